@@ -1,11 +1,125 @@
 import { spawn } from 'child_process';
 import path from 'path';
+import readline from 'readline';
 import { fileURLToPath } from 'url';
 
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = path.dirname(__filename);
 const scriptPath = path.join(__dirname, 'atlas_grid_scan.py');
-const forwardArgs = [scriptPath, ...process.argv.slice(2)];
+
+const PYTHON_NOT_FOUND = '未找到可用的 Python，请先安装并确保命令可用。';
+
+const pythonCandidates = () => [
+  ['python', []],
+  ...(process.platform === 'win32' ? [['py', ['-3']]] : []),
+];
+
+/**
+ * 常驻扫描进程：整个会话只启动一次 Python（`atlas_grid_scan.py --worker`），
+ * 同一张图反复调参时复用已解码的灰度图。
+ *
+ *   const worker = new AtlasScanWorker();
+ *   const { config, notes } = await worker.scan({ image: 'cards.webp', metric: 'variance', 'auto-threshold': 0.12 });
+ *   await worker.close();
+ *
+ * scan 的参数键与批量清单相同（命令行参数名，`auto-threshold` / `auto_threshold` 均可）。
+ */
+export class AtlasScanWorker {
+  constructor({ noCache = false, cacheMb } = {}) {
+    this.args = [scriptPath, '--worker'];
+    if (noCache) this.args.push('--no-cache');
+    if (cacheMb !== undefined) this.args.push('--worker-cache-mb', String(cacheMb));
+    this.child = null;
+    this.starting = null;
+    this.nextId = 1;
+    this.pending = new Map();
+  }
+
+  start() {
+    if (!this.starting) {
+      this.starting = this.spawnFirstAvailable(pythonCandidates());
+    }
+    return this.starting;
+  }
+
+  spawnFirstAvailable(candidates) {
+    const [candidate, ...rest] = candidates;
+    if (!candidate) return Promise.reject(new Error(PYTHON_NOT_FOUND));
+    const [command, prefix] = candidate;
+    return new Promise((resolve, reject) => {
+      const child = spawn(command, [...prefix, ...this.args], { stdio: ['pipe', 'pipe', 'inherit'] });
+      child.once('spawn', () => {
+        this.attach(child);
+        resolve(child);
+      });
+      child.once('error', (error) => {
+        if (error && error.code === 'ENOENT') {
+          this.spawnFirstAvailable(rest).then(resolve, reject);
+        } else {
+          reject(error);
+        }
+      });
+    });
+  }
+
+  attach(child) {
+    this.child = child;
+    readline.createInterface({ input: child.stdout }).on('line', (line) => {
+      let response;
+      try {
+        response = JSON.parse(line);
+      } catch {
+        console.error('[atlas-scan] 无法解析 worker 输出:', line);
+        return;
+      }
+      const request = this.pending.get(response.id);
+      if (!request) return;
+      this.pending.delete(response.id);
+      if (response.ok) {
+        request.resolve(response);
+      } else {
+        request.reject(new Error(response.error));
+      }
+    });
+    child.on('exit', (code) => {
+      this.child = null;
+      this.starting = null;
+      for (const request of this.pending.values()) {
+        request.reject(new Error(`图集扫描 worker 已退出 (code ${code ?? 'null'})`));
+      }
+      this.pending.clear();
+    });
+  }
+
+  async request(payload) {
+    const child = await this.start();
+    const id = this.nextId++;
+    return new Promise((resolve, reject) => {
+      this.pending.set(id, { resolve, reject });
+      child.stdin.write(`${JSON.stringify({ id, ...payload })}\n`);
+    });
+  }
+
+  /** 扫描一张图集，返回 { config, notes, decoded, seconds }。 */
+  scan(options) {
+    return this.request({ command: 'scan', options });
+  }
+
+  /** 解码缓存（images）与结果缓存（cache）的命中统计。 */
+  async stats() {
+    const response = await this.request({ command: 'stats' });
+    return response.stats;
+  }
+
+  async close() {
+    if (!this.child) return;
+    const child = this.child;
+    const exited = new Promise((resolve) => child.once('exit', resolve));
+    await this.request({ command: 'shutdown' });
+    child.stdin.end();
+    await exited;
+  }
+}
 
 const runCommand = (command, args) =>
   new Promise((resolve, reject) => {
@@ -15,6 +129,7 @@ const runCommand = (command, args) =>
   });
 
 const runPython = async () => {
+  const forwardArgs = [scriptPath, ...process.argv.slice(2)];
   try {
     const code = await runCommand('python', forwardArgs);
     process.exit(code);
@@ -30,13 +145,16 @@ const runPython = async () => {
       const code = await runCommand('py', ['-3', ...forwardArgs]);
       process.exit(code);
     } catch (error) {
-      console.error('未找到可用的 Python，请先安装并确保命令可用。');
+      console.error(PYTHON_NOT_FOUND);
       process.exit(1);
     }
   }
 
-  console.error('未找到可用的 Python，请先安装并确保命令可用。');
+  console.error(PYTHON_NOT_FOUND);
   process.exit(1);
 };
 
-runPython();
+// 作为模块 import（使用 AtlasScanWorker）时不执行命令行转发
+if (process.argv[1] && path.resolve(process.argv[1]) === __filename) {
+  runPython();
+}
@@ -1,17 +1,84 @@
 from __future__ import annotations
 
 import argparse
+import bisect
+import itertools
 import json
+import math
+import os
+import re
 import sys
-from typing import Iterable, List, Tuple
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
 
-from PIL import Image
+from PIL import Image, ImageChops
 
+from atlas_scan_cache import PIXEL_CACHE_ENABLED, DecodedPixelCache, ScanResultCache, hash_file
+from compress_images import MAX_EDGE as VARIANT_MAX_EDGE, SKIP_DIR as VARIANT_DIR, VALID_EXTS as VARIANT_SOURCE_EXTS
+from compress_images import RESAMPLE as VARIANT_RESAMPLE, WEBP_QUALITY
+from integral_image import IntegralImage, load_integral_image
+from png_strip_decoder import PngStripDecoder, UnsupportedPngError
 
-def analyze_grid(image_path: str, rows: int, cols: int) -> None:
+try:
+    import numpy as np
+except ImportError as exc:
+    raise SystemExit("缺少 NumPy 依赖，请先执行: python -m pip install numpy") from exc
+
+# 扫描算法变化会改变同参数下的结果，升级此版本号使旧的结果缓存失效
+SCAN_CACHE_VERSION = 1
+PROFILE_METRICS = ('max', 'mean', 'variance', 'edge')
+# 扫描所用的单通道：luminance=灰度（默认），alpha=不透明度（透明精灵图），max-rgb=RGB 三通道取最大
+SCAN_CHANNELS = ('luminance', 'alpha', 'max-rgb')
+# 分条处理的行数：int64 中间结果只按条分配，8k 宽图集也不会占满内存
+PROFILE_STRIP_ROWS = 256
+# 流式扫描按每像素峰值开销估算条带行数：滤波数据 + 条带 PNG + Pillow 条带图 + 灰度副本 + 归约临时数组
+STREAM_BYTES_PER_PIXEL = 32
+# 金字塔扫描支持的缩小倍数（Image.reduce 整数倍下采样）
+PYRAMID_FACTORS = (2, 4, 8)
+DEFAULT_MEMORY_BUDGET_MB = float(os.getenv('ATLAS_SCAN_MEMORY_BUDGET_MB', '128'))
+# 低分辨率解码支持的缩小倍数：JPEG 可在 DCT 阶段直接按 1/2、1/4、1/8 解码，其它格式整图解码后 Image.reduce
+COARSE_DECODE_FACTORS = (2, 4, 8)
+# 模板校验时每个段边界向内采样的行/列数（间隙全部采样）
+TEMPLATE_PROBE_LINES = 2
+# 自动阈值模板校验时最多批量尝试的候选阈值数
+TEMPLATE_MAX_CUTS = 512
+# 各缩小滤波器的支撑半径（源图像素间距）。派生缩放变体配置时，段边界可按缩放图上的实际边界挪动，
+# 允许的像素数见 variant_snap_tolerance
+RESAMPLE_SUPPORT = {
+    Image.NEAREST: 0.0,
+    Image.BOX: 0.5,
+    Image.BILINEAR: 1.0,
+    Image.HAMMING: 1.0,
+    Image.BICUBIC: 2.0,
+    Image.LANCZOS: 3.0,
+}
+TEMPLATE_GEOMETRY_KEYS = (
+    'imageW', 'imageH', 'rowStarts', 'rowHeights', 'colStarts', 'colWidths', 'rowColStarts', 'rowColWidths',
+)
+# 空格判定：格子中心区域（四周各留 CELL_CHECK_MARGIN 像素）平均亮度低于 EMPTY_CELL_MEAN 视为空
+CELL_CHECK_MARGIN = 50
+EMPTY_CELL_MEAN = 10
+SLICE_FORMATS = ('png', 'webp')
+# 常驻进程（--worker）保留解码灰度图的内存上限
+DEFAULT_WORKER_CACHE_MB = float(os.getenv('ATLAS_SCAN_WORKER_CACHE_MB', '512'))
+
+
+def analyze_grid(image_path: str, rows: int, cols: int, reduce: int = 1) -> None:
     try:
-        img = Image.open(image_path).convert('L')
-        w, h = img.size
+        if reduce > 1:
+            # 只看每格中心的平均亮度，低分辨率解码即可；矩形按实际缩放比例换算到小图坐标
+            pixels, (w, h) = load_grayscale_reduced(image_path, reduce)
+            integral = IntegralImage(pixels)
+            scale_x, scale_y = w / integral.width, h / integral.height
+        else:
+            integral = load_integral_image(image_path)
+            w, h = integral.size
+            scale_x = scale_y = 1
         print(f"Image: {image_path} ({w}x{h})")
 
         cell_w = w // cols
@@ -26,13 +93,22 @@ def analyze_grid(image_path: str, rows: int, cols: int) -> None:
                 x = c * cell_w
                 y = r * cell_h
                 # Check center area (avoid borders)
-                box = (x + 50, y + 50, x + cell_w - 50, y + cell_h - 50)
-                cell = img.crop(box)
+                box = (
+                    x + CELL_CHECK_MARGIN,
+                    y + CELL_CHECK_MARGIN,
+                    x + cell_w - CELL_CHECK_MARGIN,
+                    y + cell_h - CELL_CHECK_MARGIN,
+                )
+                if reduce > 1:
+                    box = (
+                        round(box[0] / scale_x),
+                        round(box[1] / scale_y),
+                        round(box[2] / scale_x),
+                        round(box[3] / scale_y),
+                    )
+                avg = integral.rect_mean(box)
 
-                pixels = list(cell.getdata())
-                avg = sum(pixels) / len(pixels)
-
-                if avg < 10:
+                if avg < EMPTY_CELL_MEAN:
                     mark = ".."  # Empty/Black
                 else:
                     mark = f"{idx:02}"  # Content
@@ -44,31 +120,92 @@ def analyze_grid(image_path: str, rows: int, cols: int) -> None:
         print(f"Error: {e}")
 
 
-def build_segments(flags: Iterable[bool], gap_merge: int, min_segment: int) -> List[Tuple[int, int]]:
-    flags_list = list(flags)
-    segments: List[Tuple[int, int]] = []
-    start = None
-    for idx, flag in enumerate(flags_list):
-        if flag and start is None:
-            start = idx
-        elif not flag and start is not None:
-            segments.append((start, idx - start))
-            start = None
-    if start is not None:
-        segments.append((start, len(flags_list) - start))
-
-    if gap_merge > 0 and len(segments) > 1:
-        merged: List[Tuple[int, int]] = [segments[0]]
-        for seg in segments[1:]:
-            prev_start, prev_len = merged[-1]
-            gap = seg[0] - (prev_start + prev_len)
-            if gap <= gap_merge:
-                merged[-1] = (prev_start, (seg[0] + seg[1]) - prev_start)
-            else:
-                merged.append(seg)
-        segments = merged
+def cell_center_box(box: Tuple[int, int, int, int], margin: int = CELL_CHECK_MARGIN) -> Tuple[int, int, int, int]:
+    """--slice 空格判定用的中心区域；格子太小时边距收缩到宽/高的 1/4，保证区域非空。
+
+    网格诊断（analyze_grid）保持固定边距，不经过这里，已有诊断结果不受影响。
+    """
+    x0, y0, x1, y1 = box
+    margin_x = min(margin, (x1 - x0) // 4)
+    margin_y = min(margin, (y1 - y0) // 4)
+    return x0 + margin_x, y0 + margin_y, x1 - margin_x, y1 - margin_y
+
+
+def _run_bounds(flags: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """按行找出 True 连续段：返回 (所在行, 起点, 终点)，终点不含；flags 为 (行数, 长度) 的布尔矩阵。"""
+    rows = flags.shape[0]
+    padded = np.zeros((rows, flags.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = flags
+    steps = np.diff(padded, axis=1)
+    # 逐行按行优先顺序取出，起点与终点一一对应
+    start_rows, starts = np.nonzero(steps == 1)
+    _, ends = np.nonzero(steps == -1)
+    return start_rows, starts, ends
+
+
+def _merge_runs(
+    rows: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    gap_merge: int,
+    min_segment: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """同一行内间距 <= gap_merge 的相邻段合并，再去掉长度 < min_segment 的段。"""
+    if gap_merge > 0 and len(starts) > 1:
+        breaks = (starts[1:] - ends[:-1] > gap_merge) | (rows[1:] != rows[:-1])
+        first = np.concatenate(([True], breaks))
+        last = np.concatenate((breaks, [True]))
+        rows, starts, ends = rows[first], starts[first], ends[last]
+    keep = ends - starts >= min_segment
+    return rows[keep], starts[keep], ends[keep]
+
+
+def _split_rows(rows: np.ndarray, starts: np.ndarray, ends: np.ndarray, count: int) -> List[List[Tuple[int, int]]]:
+    if count == 0:
+        return []
+    cuts = np.searchsorted(rows, np.arange(1, count))
+    lengths = (ends - starts).tolist()
+    starts = starts.tolist()
+    bounds = [0, *cuts.tolist(), len(starts)]
+    return [list(zip(starts[lo:hi], lengths[lo:hi])) for lo, hi in zip(bounds, bounds[1:])]
+
+
+def segment_flag_rows(flags: np.ndarray, gap_merge: int, min_segment: int) -> List[List[Tuple[int, int]]]:
+    """build_segments 的批量版：布尔矩阵每一行各自切段（如同一条曲线在多个阈值下的命中标记）。"""
+    flags = np.atleast_2d(np.asarray(flags, dtype=bool))
+    rows, starts, ends = _merge_runs(*_run_bounds(flags), gap_merge, min_segment)
+    return _split_rows(rows, starts, ends, flags.shape[0])
+
 
-    return [seg for seg in segments if seg[1] >= min_segment]
+def segments_at_thresholds(
+    values: Sequence[float],
+    thresholds: Sequence[float],
+    detect_mode: str,
+    gap_merge: int,
+    gap_min_segment: int,
+    min_segment: int,
+) -> List[List[Tuple[int, int]]]:
+    """同一条曲线在多个阈值下的分段结果，一次矩阵运算完成；与逐个阈值调用 compute_segments 一致。"""
+    values = np.asarray(values)
+    cuts = np.asarray(thresholds, dtype=np.float64)[:, None]
+    if detect_mode == 'content':
+        return segment_flag_rows(values > cuts, gap_merge, min_segment)
+    flags = values > cuts if detect_mode == 'gap-high' else values < cuts
+    rows, starts, ends = _merge_runs(*_run_bounds(flags), gap_merge, gap_min_segment)
+    # 间隙段涂回掩码后取反，连续段即为内容段（等价于 invert_segments）
+    # 连续段之间至少隔一个位置，起点与终点不会落在同一格，直接赋值即可
+    marks = np.zeros((flags.shape[0], flags.shape[1] + 1), dtype=np.int8)
+    marks[rows, starts] = 1
+    marks[rows, ends] = -1
+    content = np.cumsum(marks[:, :-1], axis=1, dtype=np.int32) == 0
+    rows, starts, ends = _merge_runs(*_run_bounds(content), 0, min_segment)
+    return _split_rows(rows, starts, ends, flags.shape[0])
+
+
+def build_segments(flags: Iterable[bool], gap_merge: int, min_segment: int) -> List[Tuple[int, int]]:
+    if not isinstance(flags, np.ndarray):
+        flags = np.fromiter(flags, dtype=bool)
+    return segment_flag_rows(flags, gap_merge, min_segment)[0]
 
 
 def invert_segments(total: int, gaps: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
@@ -76,19 +213,752 @@ def invert_segments(total: int, gaps: List[Tuple[int, int]]) -> List[Tuple[int,
         return []
     if not gaps:
         return [(0, total)]
-    segments: List[Tuple[int, int]] = []
-    cursor = 0
-    for start, length in gaps:
-        if start > cursor:
-            segments.append((cursor, start - cursor))
-        cursor = start + length
-    if cursor < total:
-        segments.append((cursor, total - cursor))
-    return segments
+    bounds = np.asarray(gaps, dtype=np.int64)
+    # 内容段夹在相邻间隙之间：[上一个间隙终点, 下一个间隙起点)
+    starts = np.concatenate(([0], bounds[:, 0] + bounds[:, 1]))
+    ends = np.concatenate((bounds[:, 0], [total]))
+    keep = ends > starts
+    return list(zip(starts[keep].tolist(), (ends - starts)[keep].tolist()))
+
+
+@dataclass(frozen=True)
+class ThresholdBand:
+    """阈值落在该区间内时，识别出的段数恒为 count。
+
+    content / gap-high 模式（值 > 阈值视为命中）区间为 [low, high)，
+    gap 模式（值 < 阈值视为命中）区间为 (low, high]。
+    """
+
+    low: float
+    high: float
+    count: int
+    low_inclusive: bool
+
+    def contains(self, value: float) -> bool:
+        if self.low_inclusive:
+            return self.low <= value < self.high
+        return self.low < value <= self.high
+
+    def pick(self) -> float:
+        """取区间中点作为阈值；单侧无界时向外偏移 1。"""
+        if math.isinf(self.low) and math.isinf(self.high):
+            return 0.0
+        if math.isinf(self.low):
+            return self.high - 1.0
+        if math.isinf(self.high):
+            return self.low + 1.0
+        mid = self.low + (self.high - self.low) / 2
+        if self.contains(mid):
+            return mid
+        # 相邻浮点数之间的中点可能舍入到开区间一端，退回闭区间端点
+        return self.low if self.low_inclusive else self.high
+
+
+def segment_count_curve(
+    values: Sequence[float],
+    detect_mode: str,
+    gap_merge: int,
+    gap_min_segment: int,
+    min_segment: int,
+) -> List[ThresholdBand]:
+    """一次排序扫描得到“阈值 -> 段数”的分段常数曲线。
+
+    按命中顺序（content / gap-high 从大到小，gap 从小到大）逐个点亮位置，用并查集维护
+    gap_merge 合并后的簇；content 模式统计长度达标的簇，gap 模式维护达标间隙簇之间的
+    内容段。每组相同取值点亮后得到一个阈值区间，结果与 compute_segments 逐个阈值计算一致。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n == 0:
+        return []
+    gap_like = detect_mode in {'gap', 'gap-high'}
+    ascending = detect_mode == 'gap'
+    order = np.argsort(values, kind='stable')
+    if not ascending:
+        order = order[::-1]
+    ordered = values[order]
+
+    radius = max(gap_merge, 0) + 1
+    cluster_min = gap_min_segment if gap_like else min_segment
+    piece_min = max(min_segment, 1)
+    parent = list(range(n))
+    lo = list(range(n))
+    hi = list(range(n))
+    active = [False] * n
+    big_starts: List[int] = []
+    big_ends: List[int] = []
+
+    def find(idx: int) -> int:
+        while parent[idx] != idx:
+            parent[idx] = parent[parent[idx]]
+            idx = parent[idx]
+        return idx
+
+    def is_big(root: int) -> bool:
+        return hi[root] - lo[root] + 1 >= cluster_min
+
+    def chain_pieces(bounds: List[Tuple[int, int]], prev_end: int, next_start: int) -> int:
+        pieces = 0
+        cursor = prev_end
+        for start, end in bounds:
+            if start - cursor >= piece_min:
+                pieces += 1
+            cursor = end
+        if next_start - cursor >= piece_min:
+            pieces += 1
+        return pieces
+
+    def activate(idx: int, count: int) -> int:
+        active[idx] = True
+        roots: List[int] = []
+        for step in (-1, 1):
+            for dist in range(1, radius + 1):
+                neighbor = idx + step * dist
+                if neighbor < 0 or neighbor >= n:
+                    break
+                if active[neighbor]:
+                    # 落在已有簇内部空隙时左右邻居属于同一个簇
+                    neighbor_root = find(neighbor)
+                    if neighbor_root not in roots:
+                        roots.append(neighbor_root)
+                    break
+        old_bigs = [root for root in roots if is_big(root)]
+        root = idx
+        for other in roots:
+            parent[other] = root
+            lo[root] = min(lo[root], lo[other])
+            hi[root] = max(hi[root], hi[other])
+        if not gap_like:
+            return count + int(is_big(root)) - len(old_bigs)
+
+        # 合并前后只影响新簇附近的内容段：前一个达标间隙 ... 后一个达标间隙
+        pos = bisect.bisect_left(big_starts, lo[root])
+        removed = len(old_bigs)
+        prev_end = big_ends[pos - 1] if pos > 0 else 0
+        next_start = big_starts[pos + removed] if pos + removed < len(big_starts) else n
+        before = chain_pieces(
+            list(zip(big_starts[pos:pos + removed], big_ends[pos:pos + removed])), prev_end, next_start
+        )
+        del big_starts[pos:pos + removed]
+        del big_ends[pos:pos + removed]
+        if is_big(root):
+            big_starts.insert(pos, lo[root])
+            big_ends.insert(pos, hi[root] + 1)
+            after = chain_pieces([(lo[root], hi[root] + 1)], prev_end, next_start)
+        else:
+            after = chain_pieces([], prev_end, next_start)
+        return count + after - before
+
+    count = (1 if n >= piece_min else 0) if gap_like else 0
+    if ascending:
+        bands = [ThresholdBand(-math.inf, float(ordered[0]), count, False)]
+    else:
+        bands = [ThresholdBand(float(ordered[0]), math.inf, count, True)]
+
+    pos = 0
+    while pos < n:
+        value = ordered[pos]
+        while pos < n and ordered[pos] == value:
+            count = activate(int(order[pos]), count)
+            pos += 1
+        following = float(ordered[pos]) if pos < n else None
+        if ascending:
+            high = math.inf if following is None else following
+            bands.append(ThresholdBand(float(value), high, count, False))
+        else:
+            low = -math.inf if following is None else following
+            bands.append(ThresholdBand(low, float(value), count, True))
+    return bands
+
+
+def solve_threshold_band(bands: List[ThresholdBand], expected: int) -> ThresholdBand | None:
+    """在段数曲线上找段数等于 expected（或最接近）的阈值区间。
+
+    相邻且段数相同的区间先合并；同样接近时取取值跨度最大的区间（最稳定），再取靠前者。
+    """
+    if not bands:
+        return None
+    merged: List[ThresholdBand] = []
+    for band in sorted(bands, key=lambda item: (item.low, item.high)):
+        if merged and merged[-1].count == band.count:
+            last = merged[-1]
+            merged[-1] = ThresholdBand(last.low, band.high, last.count, last.low_inclusive)
+        else:
+            merged.append(band)
+    return min(
+        merged,
+        key=lambda band: (abs(band.count - expected), -(band.high - band.low)),
+    )
+
+
+def clamp_scan_window(
+    width: int,
+    height: int,
+    scan_x: Tuple[int, int],
+    scan_y: Tuple[int, int],
+) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    x_start, x_end = scan_x
+    y_start, y_end = scan_y
+    x_start = max(0, min(x_start, width))
+    y_start = max(0, min(y_start, height))
+    x_end = width if x_end <= 0 else max(0, min(x_end, width))
+    y_end = height if y_end <= 0 else max(0, min(y_end, height))
+    return (x_start, x_end), (y_start, y_end)
+
+
+def _capped_max(block: np.ndarray, threshold: float, axis: int) -> np.ndarray:
+    # 逐像素扫描时 max 指标遇到首个超过阈值的像素就提前结束，这里保持相同取值
+    over = block > threshold
+    hit = over.any(axis=axis)
+    first = over.argmax(axis=axis)
+    peak = block.max(axis=axis)
+    if axis == 1:
+        picked = block[np.arange(block.shape[0]), first]
+    else:
+        picked = block[first, np.arange(block.shape[1])]
+    return np.where(hit, picked, peak)
+
+
+class _RowAccumulator:
+    """行曲线：每一行在 [x_start, x_end) 内归约，条带内即可得到最终值。"""
+
+    def __init__(self, scan_x: Tuple[int, int], scan_y: Tuple[int, int], threshold: float) -> None:
+        self.scan_x = scan_x
+        self.scan_y = scan_y
+        self.threshold = threshold
+        lines = max(0, scan_y[1] - scan_y[0])
+        self.curves = {metric: np.zeros(lines, dtype=np.float64) for metric in PROFILE_METRICS}
+
+    def feed(self, strip: np.ndarray, top: int, previous_row: np.ndarray | None) -> None:
+        x_start, x_end = self.scan_x
+        y_start, y_end = self.scan_y
+        count = x_end - x_start
+        lo = max(top, y_start)
+        hi = min(top + strip.shape[0], y_end)
+        if lo >= hi or count <= 0:
+            return
+        block = strip[lo - top:hi - top, x_start:x_end]
+        out = slice(lo - y_start, hi - y_start)
+
+        total = block.sum(axis=1, dtype=np.int64)
+        total_sq = np.square(block, dtype=np.uint32).sum(axis=1, dtype=np.int64)
+        mean = total / count
+        self.curves['mean'][out] = mean
+        self.curves['variance'][out] = (total_sq / count) - (mean * mean)
+        self.curves['max'][out] = _capped_max(block, self.threshold, axis=1)
+
+        # edge 与上一行比较，可越过窗口/条带上边界；图片第 0 行没有上一行，保持 0
+        edge = self.curves['edge'][out]
+        current = block.astype(np.int16)
+        if lo > top:
+            above = strip[lo - top - 1:hi - top - 1, x_start:x_end]
+            edge[:] = np.abs(current - above).sum(axis=1, dtype=np.int64) / count
+        else:
+            if previous_row is not None:
+                edge[0] = np.abs(current[0] - previous_row[x_start:x_end]).sum(dtype=np.int64) / count
+            if hi - lo > 1:
+                edge[1:] = np.abs(current[1:] - block[:-1]).sum(axis=1, dtype=np.int64) / count
+
+    def finish(self) -> Dict[str, np.ndarray]:
+        return self.curves
+
+
+class _ColAccumulator:
+    """列曲线：条带自上而下推进，逐条累加每一列在 [y_start, y_end) 内的统计量。"""
+
+    def __init__(self, scan_x: Tuple[int, int], scan_y: Tuple[int, int], threshold: float) -> None:
+        self.scan_x = scan_x
+        self.scan_y = scan_y
+        self.threshold = threshold
+        width = max(0, scan_x[1] - scan_x[0])
+        self.total = np.zeros(width, dtype=np.int64)
+        self.total_sq = np.zeros(width, dtype=np.int64)
+        self.edge_total = np.zeros(width, dtype=np.int64)
+        self.peak = np.zeros(width, dtype=np.uint8)
+        self.capped = np.zeros(width, dtype=np.uint8)
+        self.found = np.zeros(width, dtype=bool)
+
+    def feed(self, strip: np.ndarray, top: int, previous_row: np.ndarray | None) -> None:
+        x_start, x_end = self.scan_x
+        y_start, y_end = self.scan_y
+        lo = max(top, y_start)
+        hi = min(top + strip.shape[0], y_end)
+        if lo >= hi or x_start >= x_end:
+            return
+        rows = strip[lo - top:hi - top]
+        block = rows[:, x_start:x_end]
+
+        self.total += block.sum(axis=0, dtype=np.int64)
+        self.total_sq += np.square(block, dtype=np.uint32).sum(axis=0, dtype=np.int64)
+
+        # 首个超过阈值的像素只在第一次命中时记录，与逐像素扫描提前结束的取值一致
+        over = block > self.threshold
+        fresh = over.any(axis=0) & ~self.found
+        if fresh.any():
+            cols = np.nonzero(fresh)[0]
+            self.capped[cols] = block[over[:, cols].argmax(axis=0), cols]
+            self.found |= fresh
+        np.maximum(self.peak, block.max(axis=0), out=self.peak)
+
+        # edge 与左一列比较，可越过窗口左边界；图片第 0 列没有左侧列，保持 0
+        edge_left = max(x_start, 1)
+        if edge_left < x_end:
+            current = rows[:, edge_left:x_end].astype(np.int16)
+            previous = rows[:, edge_left - 1:x_end - 1]
+            self.edge_total[edge_left - x_start:] += np.abs(current - previous).sum(axis=0, dtype=np.int64)
+
+    def finish(self) -> Dict[str, np.ndarray]:
+        count = self.scan_y[1] - self.scan_y[0]
+        width = self.total.shape[0]
+        if count <= 0:
+            return {metric: np.zeros(width, dtype=np.float64) for metric in PROFILE_METRICS}
+        mean = self.total / count
+        return {
+            'max': np.where(self.found, self.capped, self.peak).astype(np.float64),
+            'mean': mean,
+            'variance': (self.total_sq / count) - (mean * mean),
+            'edge': self.edge_total / count,
+        }
+
+
+ProfileRequest = Tuple[str, Tuple[int, int], Tuple[int, int], float]
+Strip = Tuple[int, np.ndarray, 'np.ndarray | None']
+
+
+class PhaseTimer:
+    """按阶段累计耗时（秒），同名阶段多次进入时累加；不需要计时的调用方用默认实例，开销可忽略。"""
+
+    def __init__(self) -> None:
+        self.seconds: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def report(self) -> Dict[str, float]:
+        return {name: round(seconds, 4) for name, seconds in self.seconds.items()}
+
+
+def peak_rss_mb() -> float | None:
+    """进程峰值常驻内存（MB）；Linux/macOS 用 resource，Windows 用 GetProcessMemoryInfo，都不可用时返回 None。"""
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 单位为字节，Linux 为 KB
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ('cb', wintypes.DWORD),
+                ('PageFaultCount', wintypes.DWORD),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t),
+            ]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return round(counters.PeakWorkingSetSize / (1024 * 1024), 1)
+    return None
+
+
+class ArrayStripSource:
+    """已解码的整图灰度数组，按固定行数切条。"""
+
+    def __init__(self, pixels: np.ndarray, strip_rows: int | None = None) -> None:
+        self.pixels = pixels
+        self.height, self.width = pixels.shape[:2]
+        self.strip_rows = strip_rows
+
+    def iter_strips(self, y_lo: int, y_hi: int) -> Iterator[Strip]:
+        strip_rows = self.strip_rows or PROFILE_STRIP_ROWS
+        for top in range(y_lo, y_hi, strip_rows):
+            bottom = min(top + strip_rows, y_hi)
+            previous_row = self.pixels[top - 1] if top > 0 else None
+            yield top, self.pixels[top:bottom], previous_row
+
+
+class PngStreamSource:
+    """逐条解码 PNG 并转灰度，峰值内存只与条带行数有关，不会持有整图。"""
+
+    def __init__(
+        self,
+        decoder: PngStripDecoder,
+        strip_rows: int,
+        timer: PhaseTimer | None = None,
+        channel: str = 'luminance',
+    ) -> None:
+        self.decoder = decoder
+        self.height = decoder.height
+        self.width = decoder.width
+        self.strip_rows = strip_rows
+        self.timer = timer or PhaseTimer()
+        self.channel = channel
+
+    def iter_strips(self, y_lo: int, y_hi: int) -> Iterator[Strip]:
+        # PNG 只能从头顺序解码，窗口之前的条带解码后直接丢弃；累加器自行裁剪到各自窗口
+        previous_row = None
+        strips = self.decoder.iter_strips(self.strip_rows, stop_row=y_hi)
+        while True:
+            with self.timer.phase('decode'):
+                item = next(strips, None)
+            if item is None:
+                return
+            top, img = item
+            with self.timer.phase('grayscale'):
+                strip = channel_array(img, self.channel)
+            del item, img
+            if top + strip.shape[0] > y_lo:
+                yield top, strip, previous_row
+            previous_row = strip[-1]
+
+
+class PrecomputedSource:
+    """只有尺寸、没有像素的占位来源：曲线已预先算好（如自动调参的子进程），不能再做条带遍历。"""
+
+    def __init__(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+
+    def iter_strips(self, y_lo: int, y_hi: int) -> Iterator[Strip]:
+        raise ValueError('Profile was not precomputed for this window')
+
+
+def strip_rows_for_budget(width: int, memory_budget_mb: float) -> int:
+    return max(1, int(memory_budget_mb * 1024 * 1024 // (max(1, width) * STREAM_BYTES_PER_PIXEL)))
+
+
+def open_profile_source(
+    image_path: str,
+    memory_budget_mb: float | None,
+    messages: List[str],
+    timer: PhaseTimer | None = None,
+    channel: str = 'luminance',
+    pixel_cache: DecodedPixelCache | None = None,
+    image_hash: str | None = None,
+) -> ArrayStripSource | PngStreamSource:
+    if memory_budget_mb is None:
+        return ArrayStripSource(load_pixels(image_path, timer, channel, pixel_cache, image_hash))
+    if pixel_cache is not None:
+        # 已缓存的平面是内存映射，按条带遍历时只分页读入用到的行，比流式解码更省时且同样不占整图内存
+        pixels = cached_pixels(image_path, timer, channel, pixel_cache, image_hash)
+        if pixels is not None:
+            return ArrayStripSource(pixels)
+    try:
+        decoder = PngStripDecoder(image_path)
+    except UnsupportedPngError as exc:
+        messages.append(f"[info] 流式扫描回退为整图解码：{exc}")
+        return ArrayStripSource(load_pixels(image_path, timer, channel, pixel_cache, image_hash))
+    return PngStreamSource(decoder, strip_rows_for_budget(decoder.width, memory_budget_mb), timer, channel)
+
+
+class ProfileCache:
+    """同一张灰度图的行/列指标曲线缓存。
+
+    一次条带遍历同时算出所有请求窗口的 max / mean / variance / edge 四条曲线，
+    并按需保留排好序的副本，供自动阈值按分位数取值时直接索引。
+    max 曲线与逐像素扫描的提前结束取值一致，因此缓存键里带上阈值。
+    """
+
+    def __init__(
+        self,
+        source: np.ndarray | ArrayStripSource | PngStreamSource | PrecomputedSource,
+        timer: PhaseTimer | None = None,
+    ) -> None:
+        if isinstance(source, np.ndarray):
+            source = ArrayStripSource(source)
+        self.source = source
+        self.timer = timer or PhaseTimer()
+        self.height = source.height
+        self.width = source.width
+        self._curves: Dict[tuple, np.ndarray] = {}
+        self._sorted: Dict[tuple, np.ndarray] = {}
+
+    @classmethod
+    def from_curves(cls, exported: dict) -> ProfileCache:
+        cache = cls(PrecomputedSource(exported['width'], exported['height']))
+        cache._curves.update(exported['curves'])
+        return cache
+
+    def export_curves(self) -> dict:
+        """导出已算好的曲线（只有一维数组，不含图像），供子进程用 from_curves 重建。"""
+        return {'width': self.width, 'height': self.height, 'curves': dict(self._curves)}
+
+    def window(self, scan_x: Tuple[int, int], scan_y: Tuple[int, int]) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        return clamp_scan_window(self.width, self.height, scan_x, scan_y)
+
+    @staticmethod
+    def _key(axis: str, metric: str, threshold: float, scan_x: Tuple[int, int], scan_y: Tuple[int, int]) -> tuple:
+        return (axis, metric, threshold if metric == 'max' else None, scan_x, scan_y)
+
+    def warm(self, requests: Iterable[ProfileRequest]) -> None:
+        """对尚未缓存的 (axis, scan_x, scan_y, threshold) 请求做一次合并遍历。"""
+        accumulators = []
+        seen = set()
+        for axis, scan_x, scan_y, threshold in requests:
+            if axis not in {'row', 'col'}:
+                raise ValueError(f"Unsupported axis: {axis}")
+            scan_x, scan_y = self.window(scan_x, scan_y)
+            key = self._key(axis, 'max', threshold, scan_x, scan_y)
+            if key in self._curves or key in seen:
+                continue
+            seen.add(key)
+            factory = _RowAccumulator if axis == 'row' else _ColAccumulator
+            accumulators.append((axis, factory(scan_x, scan_y, threshold)))
+        if not accumulators:
+            return
+
+        y_lo = min(acc.scan_y[0] for _, acc in accumulators)
+        y_hi = max(acc.scan_y[1] for _, acc in accumulators)
+        for top, strip, previous_row in self.source.iter_strips(y_lo, y_hi):
+            for axis, acc in accumulators:
+                with self.timer.phase(f'{axis}Profile'):
+                    acc.feed(strip, top, previous_row)
+
+        for axis, acc in accumulators:
+            for metric, curve in acc.finish().items():
+                self._curves[self._key(axis, metric, acc.threshold, acc.scan_x, acc.scan_y)] = curve
+
+    def values(
+        self,
+        axis: str,
+        metric: str,
+        threshold: float,
+        scan_x: Tuple[int, int],
+        scan_y: Tuple[int, int],
+    ) -> np.ndarray:
+        scan_x, scan_y = self.window(scan_x, scan_y)
+        key = self._key(axis, metric, threshold, scan_x, scan_y)
+        if key not in self._curves:
+            self.warm([(axis, scan_x, scan_y, threshold)])
+        return self._curves[key]
+
+    def sorted_values(
+        self,
+        axis: str,
+        metric: str,
+        threshold: float,
+        scan_x: Tuple[int, int],
+        scan_y: Tuple[int, int],
+    ) -> np.ndarray:
+        scan_x, scan_y = self.window(scan_x, scan_y)
+        key = self._key(axis, metric, threshold, scan_x, scan_y)
+        ordered = self._sorted.get(key)
+        if ordered is None:
+            ordered = np.sort(self.values(axis, metric, threshold, scan_x, scan_y))
+            self._sorted[key] = ordered
+        return ordered
+
+
+def compute_axis_profile(
+    pixels: np.ndarray,
+    axis: str,
+    metric: str,
+    threshold: float,
+    scan_x: Tuple[int, int],
+    scan_y: Tuple[int, int],
+) -> np.ndarray:
+    """计算扫描窗口内每一行 (row) 或每一列 (col) 的指标曲线。
+
+    scan_x / scan_y 为已限制在图片范围内的 [start, end) 区间，按条带做整行/整列归约，
+    取值与逐像素遍历的结果逐项一致。
+    """
+    return ProfileCache(pixels).values(axis, metric, threshold, scan_x, scan_y)
+
+
+def channel_array(img: Image.Image, channel: str = 'luminance') -> np.ndarray:
+    """取出扫描用的单通道 uint8 数组。
+
+    alpha / max-rgb 直接在 Pillow 的波段上取值，不做整图灰度换算；调色板图按 tRNS 透明信息展开。
+    """
+    if channel == 'luminance':
+        return np.asarray(img.convert('L'))
+    if channel == 'alpha':
+        if 'A' not in img.getbands():
+            if 'transparency' not in img.info:
+                raise ValueError(f"Image mode {img.mode} has no alpha channel")
+            img = img.convert('RGBA')
+        return np.asarray(img.getchannel('A'))
+    if channel == 'max-rgb':
+        if img.mode in {'L', 'LA'}:
+            return np.asarray(img.getchannel('L'))
+        if img.mode not in {'RGB', 'RGBA'}:
+            img = img.convert('RGB')
+        red, green, blue = (img.getchannel(band) for band in 'RGB')
+        return np.asarray(ImageChops.lighter(ImageChops.lighter(red, green), blue))
+    raise ValueError(f"Unsupported channel: {channel}")
+
+
+def load_grayscale(image_path: str, timer: PhaseTimer | None = None, channel: str = 'luminance') -> np.ndarray:
+    timer = timer or PhaseTimer()
+    with Image.open(image_path) as img:
+        with timer.phase('decode'):
+            img.load()
+        with timer.phase('grayscale'):
+            return channel_array(img, channel)
+
+
+def cached_pixels(
+    image_path: str,
+    timer: PhaseTimer | None,
+    channel: str,
+    pixel_cache: DecodedPixelCache,
+    image_hash: str | None = None,
+) -> np.ndarray | None:
+    timer = timer or PhaseTimer()
+    with timer.phase('pixelCache'):
+        key = pixel_cache.make_key(image_hash or hash_file(image_path), channel)
+        return pixel_cache.get(key)
+
+
+def load_pixels(
+    image_path: str,
+    timer: PhaseTimer | None = None,
+    channel: str = 'luminance',
+    pixel_cache: DecodedPixelCache | None = None,
+    image_hash: str | None = None,
+) -> np.ndarray:
+    """整图灰度数组；给定解码像素缓存时命中直接映射读入（只读），未命中解码后写入缓存。"""
+    if pixel_cache is None:
+        return load_grayscale(image_path, timer, channel)
+    timer = timer or PhaseTimer()
+    image_hash = image_hash or hash_file(image_path)
+    pixels = cached_pixels(image_path, timer, channel, pixel_cache, image_hash)
+    if pixels is None:
+        pixels = load_grayscale(image_path, timer, channel)
+        with timer.phase('pixelCache'):
+            pixel_cache.put(pixel_cache.make_key(image_hash, channel), pixels)
+    return pixels
+
+
+def load_grayscale_reduced(
+    image_path: str,
+    factor: int,
+    timer: PhaseTimer | None = None,
+    channel: str = 'luminance',
+) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """按 1/factor 分辨率解码为灰度数组，返回 (数组, 原图尺寸)。
+
+    JPEG 用 draft 在 DCT 阶段直接缩小并跳过色度，解码耗时与内存随倍数下降；
+    draft 达不到的剩余倍数（以及 PNG/WebP 等不支持 draft 的格式）在转灰度后用 Image.reduce 块均值补齐。
+    缩小图尺寸向上取整，调用方应按 原图尺寸 / 数组尺寸 换算坐标。
+    """
+    if factor not in COARSE_DECODE_FACTORS:
+        raise ValueError(f"Unsupported decode reduction factor: {factor}")
+    timer = timer or PhaseTimer()
+    with Image.open(image_path) as img:
+        source_size = img.size
+        with timer.phase('decode'):
+            if img.format == 'JPEG':
+                # draft 选不小于请求尺寸的最小 DCT 缩放，请求尺寸向下取整才能取到 1/factor
+                mode = 'L' if channel == 'luminance' else 'RGB'
+                img.draft(mode, (max(1, source_size[0] // factor), max(1, source_size[1] // factor)))
+            img.load()
+        with timer.phase('grayscale'):
+            gray = Image.fromarray(channel_array(img, channel))
+            remaining = max(1, factor // max(1, round(source_size[0] / gray.width)))
+            if remaining > 1:
+                gray = gray.reduce(remaining)
+            return np.asarray(gray), source_size
+
+
+def shrink_window(window: Tuple[int, int], scale: float) -> Tuple[int, int]:
+    """把原图坐标的扫描区间换算到缩小图上（结束 <=0 表示到边界，保持不变）。"""
+    start, end = window
+    return int(start // scale), end if end <= 0 else math.ceil(end / scale)
+
+
+def expand_segments(segments: List[Tuple[int, int]], scale: float, total: int) -> List[Tuple[int, int]]:
+    """把缩小图上的段换算回原图坐标，并裁到原图范围内。"""
+    expanded: List[Tuple[int, int]] = []
+    for start, length in segments:
+        lo = min(total, round(start * scale))
+        hi = min(total, round((start + length) * scale))
+        expanded.append((lo, hi - lo))
+    return expanded
+
+
+class DecodedImageCache:
+    """常驻进程内的灰度图 LRU：同一张图反复调参时跳过解码。
+
+    键为 (绝对路径, mtime, 文件大小)，图片被改写后自动失效；按灰度数组总字节数淘汰最久未用的图。
+    """
+
+    def __init__(self, max_bytes: int = int(DEFAULT_WORKER_CACHE_MB * 1024 * 1024)) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._images: OrderedDict[tuple, np.ndarray] = OrderedDict()
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(pixels.nbytes for pixels in self._images.values())
+
+    def load(
+        self,
+        image_path: str,
+        timer: PhaseTimer | None = None,
+        channel: str = 'luminance',
+        pixel_cache: DecodedPixelCache | None = None,
+    ) -> np.ndarray:
+        stat = os.stat(image_path)
+        key = (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size, channel)
+        pixels = self._images.get(key)
+        if pixels is not None:
+            self.hits += 1
+            self._images.move_to_end(key)
+            return pixels
+        self.misses += 1
+        pixels = load_pixels(image_path, timer, channel, pixel_cache)
+        self._images[key] = pixels
+        # 至少保留刚解码的这张，即使单张就超出上限
+        while len(self._images) > 1 and self.total_bytes > self.max_bytes:
+            self._images.popitem(last=False)
+        return pixels
+
+    def stats(self) -> dict:
+        return {
+            'images': len(self._images),
+            'bytes': self.total_bytes,
+            'maxBytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+def quantile_threshold(ordered: np.ndarray, quantile: float, detect_mode: str) -> float:
+    """自动阈值：gap / gap-high 取排好序曲线的分位数，content 取 最小值 + (最大值 - 最小值) * quantile。"""
+    if detect_mode in {'gap', 'gap-high'}:
+        idx = int(round((len(ordered) - 1) * quantile))
+        idx = max(0, min(idx, len(ordered) - 1))
+        return float(ordered[idx])
+    min_val = float(ordered[0])
+    max_val = float(ordered[-1])
+    return min_val + (max_val - min_val) * quantile
 
 
 def scan_axis_metric(
-    img: Image.Image,
+    img: Image.Image | np.ndarray | None,
     axis: str,
     metric: str,
     threshold: float,
@@ -100,147 +970,195 @@ def scan_axis_metric(
     gap_min_segment: int,
     min_segment: int,
     expected_segments: int | None,
+    profiles: ProfileCache | None = None,
+    resolved: Dict[str, float] | None = None,
+    channel: str = 'luminance',
 ) -> List[Tuple[int, int]]:
-    pixels = img.load()
-    w, h = img.size
-    x_start, x_end = scan_x
-    y_start, y_end = scan_y
-    x_start = max(0, min(x_start, w))
-    y_start = max(0, min(y_start, h))
-    x_end = w if x_end <= 0 else max(0, min(x_end, w))
-    y_end = h if y_end <= 0 else max(0, min(y_end, h))
-
     metric = metric.lower()
-    if metric not in {'max', 'mean', 'variance', 'edge'}:
+    if metric not in PROFILE_METRICS:
         raise ValueError(f"Unsupported metric: {metric}")
     detect_mode = detect_mode.lower()
     if detect_mode not in {'content', 'gap', 'gap-high'}:
         raise ValueError(f"Unsupported detect_mode: {detect_mode}")
-
-    values: List[float] = []
-    if axis == 'row':
-        for y in range(y_start, y_end):
-            if metric == 'edge':
-                if y == 0:
-                    values.append(0.0)
-                    continue
-                total = 0
-                count = 0
-                for x in range(x_start, x_end):
-                    total += abs(pixels[x, y] - pixels[x, y - 1])
-                    count += 1
-                values.append(total / count if count else 0)
-            elif metric == 'max':
-                maxv = 0
-                for x in range(x_start, x_end):
-                    v = pixels[x, y]
-                    maxv = v if v > maxv else maxv
-                    if maxv > threshold:
-                        break
-                values.append(float(maxv))
-            else:
-                total = 0
-                total_sq = 0
-                count = 0
-                for x in range(x_start, x_end):
-                    v = pixels[x, y]
-                    total += v
-                    total_sq += v * v
-                    count += 1
-                mean = total / count if count else 0
-                if metric == 'mean':
-                    values.append(mean)
-                else:
-                    values.append((total_sq / count) - (mean * mean) if count else 0)
-    elif axis == 'col':
-        for x in range(x_start, x_end):
-            if metric == 'edge':
-                if x == 0:
-                    values.append(0.0)
-                    continue
-                total = 0
-                count = 0
-                for y in range(y_start, y_end):
-                    total += abs(pixels[x, y] - pixels[x - 1, y])
-                    count += 1
-                values.append(total / count if count else 0)
-            elif metric == 'max':
-                maxv = 0
-                for y in range(y_start, y_end):
-                    v = pixels[x, y]
-                    maxv = v if v > maxv else maxv
-                    if maxv > threshold:
-                        break
-                values.append(float(maxv))
-            else:
-                total = 0
-                total_sq = 0
-                count = 0
-                for y in range(y_start, y_end):
-                    v = pixels[x, y]
-                    total += v
-                    total_sq += v * v
-                    count += 1
-                mean = total / count if count else 0
-                if metric == 'mean':
-                    values.append(mean)
-                else:
-                    values.append((total_sq / count) - (mean * mean) if count else 0)
-    else:
+    if axis not in {'row', 'col'}:
         raise ValueError(f"Unsupported axis: {axis}")
 
+    if profiles is None:
+        profiles = ProfileCache(channel_array(img, channel) if isinstance(img, Image.Image) else np.asarray(img))
+    scan_x, scan_y = profiles.window(scan_x, scan_y)
+    timer = profiles.timer
+    values = profiles.values(axis, metric, threshold, scan_x, scan_y)
+
     def compute_threshold(quantile: float) -> float:
-        if detect_mode in {'gap', 'gap-high'}:
-            ordered = sorted(values)
-            idx = int(round((len(ordered) - 1) * quantile))
-            idx = max(0, min(idx, len(ordered) - 1))
-            return ordered[idx]
-        min_val = min(values)
-        max_val = max(values)
-        return min_val + (max_val - min_val) * quantile
+        # 排好序的副本只算一次，之后每个分位数候选都是 O(1) 取值
+        return quantile_threshold(profiles.sorted_values(axis, metric, threshold, scan_x, scan_y), quantile, detect_mode)
 
     def compute_segments(threshold_value: float) -> List[Tuple[int, int]]:
-        if detect_mode == 'content':
-            flags = [value > threshold_value for value in values]
-            return build_segments(flags, gap_merge, min_segment)
-        if detect_mode == 'gap-high':
-            gap_flags = [value > threshold_value for value in values]
-        else:
-            gap_flags = [value < threshold_value for value in values]
-        gaps = build_segments(gap_flags, gap_merge, gap_min_segment)
-        return [seg for seg in invert_segments(len(values), gaps) if seg[1] >= min_segment]
-
-    if values:
-        if expected_segments is not None:
-            candidates = [i / 20 for i in range(1, 20)]
-            if auto_threshold is not None:
-                candidates = [auto_threshold] + [q for q in candidates if q != auto_threshold]
-            best_threshold = threshold
-            best_segments = compute_segments(best_threshold)
-            best_diff = abs(len(best_segments) - expected_segments)
-            for q in candidates:
-                current_threshold = compute_threshold(q)
-                current_segments = compute_segments(current_threshold)
-                current_diff = abs(len(current_segments) - expected_segments)
-                if current_diff < best_diff:
-                    best_diff = current_diff
-                    best_threshold = current_threshold
-                    best_segments = current_segments
-                    if best_diff == 0:
-                        break
-            threshold = best_threshold
-            segments = best_segments
-        else:
-            if auto_threshold is not None:
+        with timer.phase('segmentation'):
+            return segments_at_thresholds(
+                values, [threshold_value], detect_mode, gap_merge, gap_min_segment, min_segment
+            )[0]
+
+    if len(values):
+        if auto_threshold is not None:
+            with timer.phase('thresholdSearch'):
                 threshold = compute_threshold(auto_threshold)
-            segments = compute_segments(threshold)
+        segments = compute_segments(threshold)
+        if expected_segments is not None and len(segments) != expected_segments:
+            # 段数不符时在段数曲线上直接求出能得到预期段数（或最接近）的阈值区间
+            with timer.phase('thresholdSearch'):
+                band = solve_threshold_band(
+                    segment_count_curve(values, detect_mode, gap_merge, gap_min_segment, min_segment),
+                    expected_segments,
+                )
+            if band is not None and abs(band.count - expected_segments) < abs(len(segments) - expected_segments):
+                threshold = band.pick()
+                segments = compute_segments(threshold)
     else:
         segments = []
+    if resolved is not None:
+        resolved['threshold'] = threshold
 
-    offset = y_start if axis == 'row' else x_start
+    offset = scan_y[0] if axis == 'row' else scan_x[0]
     return [(start + offset, length) for start, length in segments]
 
 
+def pyramid_level(pixels: np.ndarray, factor: int, pooling: str) -> np.ndarray:
+    """生成缩小 factor 倍的粗扫描图，pooling 为 mean（Image.reduce 的块均值）或 max（块最大值）。"""
+    if pooling == 'mean':
+        return np.asarray(Image.fromarray(pixels).reduce(factor))
+    # 逐个步长切片取 maximum，不生成整图大小的临时数组；末尾不满一块的部分只在已有行/列里取最大值
+    rows = pixels[0::factor].copy()
+    for offset in range(1, factor):
+        part = pixels[offset::factor]
+        np.maximum(rows[:len(part)], part, out=rows[:len(part)])
+    level = rows[:, 0::factor].copy()
+    for offset in range(1, factor):
+        part = rows[:, offset::factor]
+        np.maximum(level[:, :part.shape[1]], part, out=level[:, :part.shape[1]])
+    return level
+
+
+def _raw_flags(values: np.ndarray, cut: float, detect_mode: str) -> np.ndarray:
+    """阈值比较得到的逐位置标记：content 模式为内容标记，gap/gap-high 模式为间隙标记。"""
+    return values < cut if detect_mode == 'gap' else values > cut
+
+
+def scan_axis_pyramid(
+    profiles: ProfileCache,
+    coarse_profiles: ProfileCache,
+    factor: int,
+    axis: str,
+    metric: str,
+    threshold: float,
+    auto_threshold: float | None,
+    detect_mode: str,
+    scan_x: Tuple[int, int],
+    scan_y: Tuple[int, int],
+    gap_merge: int,
+    gap_min_segment: int,
+    min_segment: int,
+    expected_segments: int | None,
+) -> List[Tuple[int, int]]:
+    """金字塔扫描：先在缩小 factor 倍的图上确定大致分段，再只在全分辨率上重算边界附近与背景。
+
+    粗图阈值只用来定位边界。每个跳变两侧各 2*factor 行/列与全部背景取原图曲线，卡牌内部取粗图曲线放大，
+    在这条近似曲线上按与 scan_axis_metric 相同的规则求阈值（固定 / 自动 / 预期段数）并切段；
+    求得的阈值下与粗图判定不一致的位置也改取原图曲线，再求解一次。
+    """
+    metric = metric.lower()
+    detect_mode = detect_mode.lower()
+    scan_x, scan_y = profiles.window(scan_x, scan_y)
+    lo_limit, hi_limit = scan_y if axis == 'row' else scan_x
+    total = hi_limit - lo_limit
+    if total <= 0:
+        return []
+    coarse_x = (scan_x[0] // factor, -(-scan_x[1] // factor))
+    coarse_y = (scan_y[0] // factor, -(-scan_y[1] // factor))
+    # 粗图上的阈值（含自动阈值、预期段数求解）按缩放后的参数确定
+    resolved: Dict[str, float] = {}
+    scan_axis_metric(
+        None,
+        axis,
+        metric,
+        threshold,
+        auto_threshold,
+        detect_mode,
+        coarse_x,
+        coarse_y,
+        gap_merge // factor,
+        max(1, gap_min_segment // factor),
+        max(1, min_segment // factor),
+        expected_segments,
+        coarse_profiles,
+        resolved,
+    )
+
+    coarse_lo = (coarse_y if axis == 'row' else coarse_x)[0]
+    coarse_values = coarse_profiles.values(axis, metric, threshold, coarse_x, coarse_y)
+    coarse_flags = _raw_flags(coarse_values, resolved['threshold'], detect_mode)
+    skip = lo_limit - coarse_lo * factor
+
+    def band_window(lo: int, hi: int) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        return (scan_x, (lo, hi)) if axis == 'row' else ((lo, hi), scan_y)
+
+    # 近似的全分辨率曲线：重算过的位置取原图曲线，其余位置取粗图曲线放大
+    values = np.repeat(coarse_values, factor)[skip:skip + total].astype(np.float64)
+    coarse_hits = np.repeat(coarse_flags, factor)[skip:skip + total]
+    refined = np.zeros(total, dtype=bool)
+
+    def refine(mask: np.ndarray) -> None:
+        marks = np.diff((mask & ~refined).astype(np.int8), prepend=0, append=0)
+        windows = [
+            (int(lo), int(hi), band_window(lo_limit + int(lo), lo_limit + int(hi)))
+            for lo, hi in zip(np.nonzero(marks == 1)[0], np.nonzero(marks == -1)[0])
+        ]
+        profiles.warm((axis, *window, threshold) for _, _, window in windows)
+        for lo, hi, window in windows:
+            values[lo:hi] = profiles.values(axis, metric, threshold, *window)
+            refined[lo:hi] = True
+
+    def compute_segments(threshold_value: float) -> List[Tuple[int, int]]:
+        with profiles.timer.phase('segmentation'):
+            return segments_at_thresholds(
+                values, [threshold_value], detect_mode, gap_merge, gap_min_segment, min_segment
+            )[0]
+
+    def solve() -> Tuple[float, List[Tuple[int, int]]]:
+        cut = threshold
+        if auto_threshold is not None:
+            with profiles.timer.phase('thresholdSearch'):
+                cut = quantile_threshold(np.sort(values), auto_threshold, detect_mode)
+        segments = compute_segments(cut)
+        if expected_segments is not None and len(segments) != expected_segments:
+            with profiles.timer.phase('thresholdSearch'):
+                band = solve_threshold_band(
+                    segment_count_curve(values, detect_mode, gap_merge, gap_min_segment, min_segment),
+                    expected_segments,
+                )
+            if band is not None and abs(band.count - expected_segments) < abs(len(segments) - expected_segments):
+                cut = band.pick()
+                segments = compute_segments(cut)
+        return cut, segments
+
+    # 背景（content 模式的未命中、gap 模式的命中）整段重算：背景上的噪声、细线在块均值里会被抹平，
+    # 粗图判定不可靠；卡牌内部在两种尺度下判定一致，只在跳变附近重算
+    mask = ~coarse_hits if detect_mode == 'content' else coarse_hits.copy()
+    radius = 2 * factor
+    # 扫描窗口两端也按边界处理：粗图的块可能跨出窗口
+    edges = np.nonzero(coarse_flags[1:] != coarse_flags[:-1])[0] + 1
+    for center in [lo_limit, *((coarse_lo + int(edge)) * factor for edge in edges), hi_limit]:
+        mask[max(0, center - lo_limit - radius):max(0, center - lo_limit + radius)] = True
+    refine(mask)
+    cut, segments = solve()
+    # 全分辨率阈值下判定与粗图不同的位置说明粗图取值贴近阈值，也改取原图曲线后再求解一次
+    flipped = ~refined & (_raw_flags(values, cut, detect_mode) != coarse_hits)
+    if flipped.any():
+        refine(flipped)
+        cut, segments = solve()
+    return [(start + lo_limit, length) for start, length in segments]
+
+
 def resolve_metric(value: str | None, fallback: str) -> str:
     return value or fallback
 
@@ -249,6 +1167,384 @@ def resolve_number(value: float | None, fallback: float | None) -> float | None:
     return fallback if value is None else value
 
 
+def report(notes: List[str] | None, message: str) -> None:
+    # 批量模式收集提示信息写入汇总，单次扫描保持直接打印
+    if notes is None:
+        print(message)
+    else:
+        notes.append(message)
+
+
+def select_row_window(row_segments: List[Tuple[int, int]], col_scan_from_row: int) -> Tuple[int, int]:
+    """col-scan-from-row：取指定行段（负数为最高的一行）的纵向范围作为列扫描区间。"""
+    if col_scan_from_row < 0:
+        target_index = max(range(len(row_segments)), key=lambda i: row_segments[i][1])
+    else:
+        target_index = min(col_scan_from_row, len(row_segments) - 1)
+    row_start, row_len = row_segments[target_index]
+    return row_start, row_start + row_len
+
+
+def verify_template_axis(
+    profiles: ProfileCache,
+    axis: str,
+    metric: str,
+    threshold: float,
+    auto_threshold: float | None,
+    detect_mode: str,
+    scan_x: Tuple[int, int],
+    scan_y: Tuple[int, int],
+    gap_merge: int,
+    gap_min_segment: int,
+    min_segment: int,
+    segments: List[Tuple[int, int]],
+    tolerance: int = 0,
+) -> Tuple[str | None, int, float | None, List[Tuple[int, int]] | None]:
+    """只采样模板间隙与段边界内侧几行/列，判断新图在该轴上能否得到与模板相同的分段。
+
+    段内部不采样、视为内容；采样值与之拼成完整曲线后，按与 scan_axis_metric 相同的合并/过滤规则切段。
+    固定阈值直接使用；自动阈值依赖整条曲线、无法在局部样本上复现，改为在相邻采样值之间的全部候选阈值上
+    一次批量切段，存在能得到模板分段的阈值即视为一致（取匹配区间的中间一个）。
+    tolerance > 0 时段数相同且每条边界偏差不超过 tolerance 也算一致，取总偏差最小的切段结果
+    （派生缩放配置用它把取整后的边界对齐到缩放图上的实际边界）。
+    返回 (不一致原因或 None, 采样行/列数, 使用的阈值, 新图上的分段)。
+    """
+    metric = metric.lower()
+    detect_mode = detect_mode.lower()
+    scan_x, scan_y = profiles.window(scan_x, scan_y)
+    lo, hi = scan_y if axis == 'row' else scan_x
+    total = hi - lo
+    if total <= 0:
+        return ('扫描区间为空', 0, None, None) if segments else (None, 0, None, [])
+    inside = np.zeros(total, dtype=bool)
+    sampled = np.zeros(total, dtype=bool)
+    for start, length in segments:
+        a, b = max(start, lo) - lo, min(start + length, hi) - lo
+        if a >= b:
+            return f'段 ({start}, {length}) 超出扫描区间', 0, None, None
+        inside[a:b] = True
+        sampled[a:min(b, a + TEMPLATE_PROBE_LINES)] = True
+        sampled[max(a, b - TEMPLATE_PROBE_LINES):b] = True
+    sampled |= ~inside
+
+    def band_window(a: int, b: int) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        return (scan_x, (a, b)) if axis == 'row' else ((a, b), scan_y)
+
+    _, starts, ends = _run_bounds(sampled[None, :])
+    ranges = [(lo + int(a), lo + int(b)) for a, b in zip(starts, ends)]
+    profiles.warm((axis, *band_window(a, b), threshold) for a, b in ranges)
+    values = np.full(total, -np.inf if detect_mode == 'gap-high' else np.inf)
+    for a, b in ranges:
+        values[a - lo:b - lo] = profiles.values(axis, metric, threshold, *band_window(a, b))
+
+    expected = [(start - lo, length) for start, length in segments]
+    if auto_threshold is None:
+        cuts = np.array([threshold], dtype=np.float64)
+    else:
+        # 分段结果只在阈值越过某个采样值时变化，相邻取值的中点即可覆盖全部情况
+        levels = np.unique(values[sampled])
+        cuts = np.concatenate(([levels[0] - 1], (levels[:-1] + levels[1:]) / 2, [levels[-1] + 1]))
+        if len(cuts) > TEMPLATE_MAX_CUTS:
+            cuts = cuts[np.linspace(0, len(cuts) - 1, TEMPLATE_MAX_CUTS).round().astype(int)]
+    results = segments_at_thresholds(values, cuts, detect_mode, gap_merge, gap_min_segment, min_segment)
+
+    def deviation(found: List[Tuple[int, int]]) -> int | None:
+        if len(found) != len(expected):
+            return None
+        total_delta = 0
+        for (start, length), (want_start, want_length) in zip(found, expected):
+            start_delta = abs(start - want_start)
+            end_delta = abs(start + length - want_start - want_length)
+            if max(start_delta, end_delta) > tolerance:
+                return None
+            total_delta += start_delta + end_delta
+        return total_delta
+
+    deviations = [deviation(found) for found in results]
+    valid = [delta for delta in deviations if delta is not None]
+    if not valid:
+        closest = min(results, key=lambda found: abs(len(found) - len(expected)))
+        return f'识别 {len(closest)} 段，模板 {len(segments)} 段或边界不同', int(sampled.sum()), None, None
+    matches = [index for index, delta in enumerate(deviations) if delta == min(valid)]
+    chosen = matches[len(matches) // 2]
+    found = [(start + lo, length) for start, length in results[chosen]]
+    return None, int(sampled.sum()), float(cuts[chosen]), found
+
+
+AxisParams = Tuple[str, float, float | None, str, Tuple[int, int], Tuple[int, int], int, int, int]
+
+
+def match_template(
+    profiles: ProfileCache,
+    template: dict,
+    height: int,
+    width: int,
+    row_params: AxisParams,
+    col_params: AxisParams,
+    uniform_rows: bool,
+    uniform_cols: bool,
+    tolerance: int = 0,
+) -> Tuple[dict, tuple | None]:
+    """按模板配置校验新图；一致时返回 (行段, 列段, 列扫描纵向区间, 逐行列段)，否则返回 None。
+
+    tolerance 为 0 时返回的就是模板各段；大于 0 时为新图上对齐后的各段（见 verify_template_axis）。
+    """
+    if (template['imageW'], template['imageH']) != (width, height):
+        reason = f"尺寸 {width}x{height} 与模板 {template['imageW']}x{template['imageH']} 不同"
+        return {'verified': False, 'reason': reason}, None
+    rows = list(zip(template['rowStarts'], template['rowHeights']))
+    cols = list(zip(template['colStarts'], template['colWidths']))
+    scan = template.get('scan', {})
+    col_scan_y = (scan['colScanYStart'], scan['colScanYEnd']) if 'colScanYStart' in scan else col_params[5]
+
+    def with_window(params: AxisParams, scan_y: Tuple[int, int]) -> AxisParams:
+        return params[:5] + (scan_y,) + params[6:]
+
+    ragged = None
+    if 'rowColStarts' in template:
+        ragged = [list(zip(starts, widths)) for starts, widths in zip(template['rowColStarts'], template['rowColWidths'])]
+
+    info: dict = {'verified': True, 'sampledRows': 0, 'sampledCols': 0}
+
+    def check(axis: str, params: AxisParams, segments: List[Tuple[int, int]]) -> List[Tuple[int, int]] | None:
+        reason, sampled, cut, found = verify_template_axis(profiles, axis, *params, segments, tolerance)
+        info['sampledRows' if axis == 'row' else 'sampledCols'] += sampled
+        if reason is not None:
+            info.clear()
+            info.update({'verified': False, 'reason': f"{'行' if axis == 'row' else '列'}: {reason}"})
+            return None
+        info.setdefault(f'{axis}Cut', cut)
+        return found
+
+    if not uniform_rows:
+        rows = check('row', row_params, rows)
+        if rows is None:
+            return info, None
+    if not uniform_cols:
+        cols = check('col', with_window(col_params, col_scan_y), cols)
+        if cols is None:
+            return info, None
+    if ragged is not None:
+        # 逐行列段按（对齐后的）行段各自的纵向区间校验
+        for index, ((start, length), segments) in enumerate(zip(rows, ragged)):
+            ragged[index] = check('col', with_window(col_params, (start, start + length)), segments)
+            if ragged[index] is None:
+                return info, None
+    return info, (rows, cols, col_scan_y, ragged)
+
+
+def load_template(path: str) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        template = json.load(f)
+    missing = [key for key in TEMPLATE_GEOMETRY_KEYS[:6] if key not in template]
+    if missing:
+        raise ValueError(f"Template {path} is missing {', '.join(missing)}")
+    return template
+
+
+def template_geometry(template: dict | None) -> dict | None:
+    """模板中决定校验结果的部分（尺寸与各段），用作结果缓存键。"""
+    if template is None:
+        return None
+    return {key: template[key] for key in TEMPLATE_GEOMETRY_KEYS if key in template}
+
+
+def template_scan_options(template: dict, options: dict) -> dict:
+    """把模板 scan 块（camelCase）换回命令行参数名，校验与回退扫描都沿用模板的扫描参数。"""
+    overrides = {}
+    for key, value in template.get('scan', {}).items():
+        dest = re.sub(r'(?<!^)(?=[A-Z])', '_', key).lower()
+        if dest in options:
+            overrides[dest] = value
+    if overrides.get('col_scan_from_row') is not None:
+        # scan 块记录的是按行段解析后的列扫描区间，交给 col-scan-from-row 在新图上重新解析
+        overrides.pop('col_scan_y_start', None)
+        overrides.pop('col_scan_y_end', None)
+    return overrides
+
+
+def variant_size(width: int, height: int, max_edge: int = VARIANT_MAX_EDGE) -> Tuple[int, int]:
+    """compress_images 生成变体的尺寸：长边超过上限时按 Image.thumbnail 的取整规则等比缩小。"""
+    if max_edge <= 0 or max(width, height) <= max_edge:
+        return width, height
+    aspect = width / height
+
+    def round_aspect(number: float, key) -> int:
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    if aspect <= 1:
+        return round_aspect(max_edge * aspect, key=lambda n: abs(aspect - n / max_edge)), max_edge
+    return max_edge, round_aspect(max_edge / aspect, key=lambda n: 0 if n == 0 else abs(aspect - max_edge / n))
+
+
+def variant_snap_tolerance(
+    source_size: Tuple[int, int],
+    target_size: Tuple[int, int],
+    resample: int = VARIANT_RESAMPLE,
+) -> int:
+    """缩放变体上段边界允许挪动的像素数。
+
+    滤波会把锐利边界糊开约半个支撑半径（LANCZOS 至少 2 像素）；缩小倍数越大，源图边界落在目标像素里的
+    取整误差也越大，至少放宽到 ceil(源尺寸 / 目标尺寸)。
+    """
+    scale = max(source / target for source, target in zip(source_size, target_size))
+    support = RESAMPLE_SUPPORT.get(resample, RESAMPLE_SUPPORT[Image.LANCZOS])
+    return max(1, math.ceil(support / 2), math.ceil(scale))
+
+
+def compressed_variants(image_path: str, width: int, height: int) -> List[Tuple[Path, Tuple[int, int]]]:
+    """compress_images 会为该图生成的变体 (路径, 尺寸)；本身就是压缩产物或不在压缩范围内时为空。"""
+    source = Path(image_path)
+    if source.parent.name == VARIANT_DIR or source.suffix.lower() not in VARIANT_SOURCE_EXTS:
+        return []
+    return [(source.parent / VARIANT_DIR / f"{source.stem}.webp", variant_size(width, height))]
+
+
+def scale_scan_block(scan: dict, scale_x: float, scale_y: float) -> dict:
+    """把 scan 块中的扫描区间与长度类参数换算到缩放图上（规则与 --coarse-decode 相同）。"""
+    scaled = dict(scan)
+    for key, value in scan.items():
+        match = re.fullmatch(r'(?:rowS|colS|s)can([XY])(Start|End)', key)
+        if match is None:
+            continue
+        scale = scale_x if match.group(1) == 'X' else scale_y
+        if match.group(2) == 'Start':
+            scaled[key] = shrink_window((value, -1), scale)[0]
+        else:
+            scaled[key] = shrink_window((0, value), scale)[1]
+    for prefix, scale in (('row', scale_y), ('col', scale_x), ('', max(scale_x, scale_y))):
+        gap_key = f'{prefix}GapMerge' if prefix else 'gapMerge'
+        min_key = f'{prefix}MinSegment' if prefix else 'minSegment'
+        scaled[gap_key] = int(scan[gap_key] // scale)
+        scaled[min_key] = max(1, int(scan[min_key] // scale))
+        if prefix:
+            scaled[f'{prefix}GapMinSegment'] = max(1, int(scan[f'{prefix}GapMinSegment'] // scale))
+    return scaled
+
+
+def derive_variant_config(config: dict, size: Tuple[int, int]) -> dict:
+    """按比例换算出缩放变体的配置（段边界四舍五入，尚未校验）。"""
+    width, height = size
+    scale_x = config['imageW'] / width
+    scale_y = config['imageH'] / height
+
+    def scaled(starts: List[int], lengths: List[int], scale: float, total: int) -> Tuple[List[int], List[int]]:
+        segments = expand_segments(list(zip(starts, lengths)), 1 / scale, total)
+        return [start for start, _ in segments], [length for _, length in segments]
+
+    derived = {
+        'imageW': width,
+        'imageH': height,
+        'rows': config['rows'],
+        'cols': config['cols'],
+        'deckX': 0,
+        'deckY': 0,
+        'deckW': width,
+        'deckH': height,
+    }
+    derived['rowStarts'], derived['rowHeights'] = scaled(config['rowStarts'], config['rowHeights'], scale_y, height)
+    derived['colStarts'], derived['colWidths'] = scaled(config['colStarts'], config['colWidths'], scale_x, width)
+    if 'rowColStarts' in config:
+        derived['rowColCounts'] = list(config['rowColCounts'])
+        ragged = [
+            scaled(starts, widths, scale_x, width)
+            for starts, widths in zip(config['rowColStarts'], config['rowColWidths'])
+        ]
+        derived['rowColStarts'] = [starts for starts, _ in ragged]
+        derived['rowColWidths'] = [widths for _, widths in ragged]
+    derived['scan'] = scale_scan_block(config['scan'], scale_x, scale_y)
+    return derived
+
+
+def scan_axis_params(scan: dict, axis: str) -> AxisParams:
+    return (
+        scan[f'{axis}Metric'],
+        scan[f'{axis}Threshold'],
+        scan[f'{axis}AutoThreshold'],
+        scan[f'{axis}DetectMode'],
+        (scan[f'{axis}ScanXStart'], scan[f'{axis}ScanXEnd']),
+        (scan[f'{axis}ScanYStart'], scan[f'{axis}ScanYEnd']),
+        scan[f'{axis}GapMerge'],
+        scan[f'{axis}GapMinSegment'],
+        scan[f'{axis}MinSegment'],
+    )
+
+
+def verify_variant_config(derived: dict, profiles: ProfileCache, tolerance: int) -> dict:
+    """在缩放图上只采样间隙与边界校验派生配置；通过时就地写回对齐后的各段，adjusted 为挪动过的边界数。"""
+    scan = derived['scan']
+    info, matched = match_template(
+        profiles,
+        derived,
+        profiles.height,
+        profiles.width,
+        scan_axis_params(scan, 'row'),
+        scan_axis_params(scan, 'col'),
+        scan['uniformRows'] is not None,
+        scan['uniformCols'] is not None,
+        tolerance,
+    )
+    info['tolerance'] = tolerance
+    if matched is None:
+        return info
+    rows, cols, _, ragged = matched
+
+    def moved(starts: List[int], lengths: List[int], segments: List[Tuple[int, int]]) -> int:
+        return sum(
+            (start != new_start) + (start + length != new_start + new_length)
+            for start, length, (new_start, new_length) in zip(starts, lengths, segments)
+        )
+
+    adjusted = moved(derived['rowStarts'], derived['rowHeights'], rows)
+    adjusted += moved(derived['colStarts'], derived['colWidths'], cols)
+    derived['rowStarts'] = [start for start, _ in rows]
+    derived['rowHeights'] = [length for _, length in rows]
+    derived['colStarts'] = [start for start, _ in cols]
+    derived['colWidths'] = [length for _, length in cols]
+    if ragged is not None:
+        adjusted += sum(map(moved, derived['rowColStarts'], derived['rowColWidths'], ragged))
+        derived['rowColStarts'] = [[start for start, _ in segments] for segments in ragged]
+        derived['rowColWidths'] = [[length for _, length in segments] for segments in ragged]
+    info['adjusted'] = adjusted
+    return info
+
+
+def emit_variant_configs(
+    config: dict,
+    image_path: str,
+    pretty: bool,
+    notes: List[str] | None = None,
+    pixel_cache: DecodedPixelCache | None = None,
+) -> List[dict]:
+    """为 compress_images 的缩放变体写出派生配置（变体同目录的 <名称>.atlas.json），返回各变体的摘要。
+
+    变体图已存在时做一次边界校验；尚未压缩时照常写出，标记为未校验。
+    """
+    summaries = []
+    channel = config['scan'].get('channel', 'luminance')
+    for variant, size in compressed_variants(image_path, config['imageW'], config['imageH']):
+        derived = derive_variant_config(config, size)
+        if not variant.exists():
+            info = {'verified': False, 'reason': '变体图不存在（尚未运行 compress_images）'}
+        else:
+            profiles = ProfileCache(load_pixels(str(variant), channel=channel, pixel_cache=pixel_cache))
+            if (profiles.width, profiles.height) != size:
+                info = {
+                    'verified': False,
+                    'reason': f"变体实际尺寸 {profiles.width}x{profiles.height} 与预期 {size[0]}x{size[1]} 不同",
+                }
+            else:
+                tolerance = variant_snap_tolerance((config['imageW'], config['imageH']), size)
+                info = verify_variant_config(derived, profiles, tolerance)
+            if not info['verified']:
+                report(notes, f"[warn] 变体 {variant} 校验未通过（{info['reason']}），已按比例取整写出")
+        derived['derivedFrom'] = {'image': image_path, 'imageW': config['imageW'], 'imageH': config['imageH'], **info}
+        output = variant.with_name(f"{variant.stem}.atlas.json")
+        write_config(derived, str(output), pretty)
+        summaries.append({'image': str(variant), 'output': str(output), 'imageW': size[0], 'imageH': size[1], **info})
+    return summaries
+
+
 def build_uniform_segments(total: int, count: int) -> List[Tuple[int, int]]:
     if count <= 0:
         raise ValueError("uniform count must be positive")
@@ -295,10 +1591,51 @@ def build_config(
     col_scan_from_row: int | None,
     expected_rows: int | None,
     expected_cols: int | None,
+    notes: List[str] | None = None,
+    cache: ScanResultCache | None = None,
+    memory_budget_mb: float | None = None,
+    pyramid: int | None = None,
+    pyramid_verify: bool = False,
+    profiles: ProfileCache | None = None,
+    timings: bool = False,
+    images: DecodedImageCache | None = None,
+    coarse_decode: int | None = None,
+    channel: str = 'luminance',
+    ragged_cols: bool = False,
+    template: dict | None = None,
+    pixel_cache: DecodedPixelCache | None = None,
 ) -> dict:
-    img = Image.open(image_path).convert('L')
-    w, h = img.size
+    if channel not in SCAN_CHANNELS:
+        raise ValueError(f"Unsupported channel: {channel}")
+    if ragged_cols and uniform_cols is not None:
+        raise ValueError('Ragged column detection cannot be combined with uniform cols')
+    if pyramid is not None and pyramid not in PYRAMID_FACTORS:
+        raise ValueError(f"Unsupported pyramid factor: {pyramid}")
+    if coarse_decode is not None:
+        if coarse_decode not in COARSE_DECODE_FACTORS:
+            raise ValueError(f"Unsupported decode reduction factor: {coarse_decode}")
+        if pyramid:
+            raise ValueError('Coarse decode cannot be combined with pyramid scan')
+    if template is not None and (pyramid or coarse_decode):
+        raise ValueError('Template verification needs full-resolution profiles (no pyramid/coarse decode)')
+    timer = PhaseTimer()
+    build_started = time.perf_counter()
 
+    def attach_timings(config: dict, cache_hit: bool) -> dict:
+        if not timings:
+            return config
+        # 计时随每次运行变化，不写入缓存；放在 scan 块之后，便于批量汇总
+        timed: dict = {}
+        for key, value in config.items():
+            timed[key] = value
+            if key == 'scan':
+                timed['timings'] = {
+                    'phases': timer.report(),
+                    'totalSeconds': round(time.perf_counter() - build_started, 4),
+                    'peakRssMB': peak_rss_mb(),
+                    'cacheHit': cache_hit,
+                }
+        return timed
     row_metric = resolve_metric(row_metric, metric)
     col_metric = resolve_metric(col_metric, metric)
     row_threshold = resolve_number(row_threshold, threshold)
@@ -319,75 +1656,297 @@ def build_config(
     row_detect_mode = (row_detect_mode or 'content').lower()
     col_detect_mode = (col_detect_mode or 'content').lower()
 
-    if uniform_rows is not None:
-        row_segments = build_uniform_segments(h, uniform_rows)
+    scan = {
+        'metric': metric,
+        'threshold': threshold,
+        'autoThreshold': auto_threshold,
+        'rowMetric': row_metric,
+        'colMetric': col_metric,
+        'rowThreshold': row_threshold,
+        'colThreshold': col_threshold,
+        'rowAutoThreshold': row_auto_threshold,
+        'colAutoThreshold': col_auto_threshold,
+        'gapMerge': gap_merge,
+        'minSegment': min_segment,
+        'rowGapMerge': row_gap_merge,
+        'colGapMerge': col_gap_merge,
+        'rowMinSegment': row_min_segment,
+        'colMinSegment': col_min_segment,
+        'rowDetectMode': row_detect_mode,
+        'colDetectMode': col_detect_mode,
+        'rowGapMinSegment': row_gap_min_segment,
+        'colGapMinSegment': col_gap_min_segment,
+        'uniformRows': uniform_rows,
+        'uniformCols': uniform_cols,
+        'scanXStart': scan_x[0],
+        'scanXEnd': scan_x[1],
+        'scanYStart': scan_y[0],
+        'scanYEnd': scan_y[1],
+        'rowScanXStart': row_scan_x[0],
+        'rowScanXEnd': row_scan_x[1],
+        'rowScanYStart': row_scan_y[0],
+        'rowScanYEnd': row_scan_y[1],
+        'colScanXStart': col_scan_x[0],
+        'colScanXEnd': col_scan_x[1],
+        'colScanYStart': col_scan_y[0],
+        'colScanYEnd': col_scan_y[1],
+        'colScanFromRow': col_scan_from_row,
+    }
+    if channel != 'luminance':
+        # 默认灰度扫描不写该字段，已有配置与缓存键保持不变
+        scan['channel'] = channel
+    if ragged_cols:
+        scan['raggedCols'] = True
+
+    cache_key = None
+    # 结果缓存与解码像素缓存共用同一次文件哈希
+    image_hash = hash_file(image_path) if cache is not None or pixel_cache is not None else None
+    if cache is not None:
+        # 列扫描区间可能随行识别结果变化，键里用识别前的完整参数；预期行/列数会影响阈值求解，一并计入
+        cache_key = cache.make_key(image_hash, {
+            'version': SCAN_CACHE_VERSION,
+            'scan': scan,
+            'expectedRows': expected_rows,
+            'expectedCols': expected_cols,
+            'pyramid': pyramid,
+            'pyramidVerify': pyramid_verify,
+            'coarseDecode': coarse_decode,
+            'template': template_geometry(template),
+        })
+        with timer.phase('cacheLookup'):
+            cached = cache.get(cache_key)
+        if cached is not None:
+            for message in cached['notes']:
+                report(notes, message)
+            return attach_timings(cached['config'], True)
+
+    messages: List[str] = []
+    # 低分辨率解码时为 (横向, 纵向) 缩放比例：原图坐标 = 缩小图坐标 * 比例
+    coarse_scale: Tuple[float, float] | None = None
+    if profiles is not None:
+        # 调用方（自动调参）已解码整图并缓存了曲线，直接复用
+        if pyramid or coarse_decode:
+            raise ValueError('Pyramid scan and coarse decode cannot reuse precomputed profiles')
+        profiles.timer = timer
+    elif coarse_decode:
+        if memory_budget_mb is not None:
+            messages.append("[info] 低分辨率解码已按倍数缩小内存占用，忽略流式扫描")
+        pixels, (w, h) = load_grayscale_reduced(image_path, coarse_decode, timer, channel)
+        profiles = ProfileCache(pixels, timer)
+        coarse_scale = (w / profiles.width, h / profiles.height)
+    elif pyramid:
+        # 金字塔模式需要整图来生成缩小图，忽略流式预算
+        if memory_budget_mb is not None:
+            messages.append("[info] 金字塔扫描需要整图解码，已忽略流式扫描")
+        if images is not None:
+            pixels = images.load(image_path, timer, channel, pixel_cache)
+        else:
+            pixels = load_pixels(image_path, timer, channel, pixel_cache, image_hash)
+        profiles = ProfileCache(pixels, timer)
+    elif images is not None and memory_budget_mb is None:
+        # 常驻进程：整图解码结果留在内存里给后续请求复用；要求流式扫描时仍按预算逐条解码
+        profiles = ProfileCache(images.load(image_path, timer, channel, pixel_cache), timer)
     else:
-        row_expected = expected_rows
-        row_segments = scan_axis_metric(
-            img,
-            'row',
-            row_metric,
-            row_threshold,
-            row_auto_threshold,
-            row_detect_mode,
-            row_scan_x,
-            row_scan_y,
-            row_gap_merge,
-            row_gap_min_segment,
-            row_min_segment,
-            row_expected,
-        )
+        source = open_profile_source(image_path, memory_budget_mb, messages, timer, channel, pixel_cache, image_hash)
+        profiles = ProfileCache(source, timer)
+    coarse_levels: Dict[str, ProfileCache] = {}
+    if coarse_scale is None:
+        h, w = profiles.height, profiles.width
+
+    def decoded_window(scan_x: Tuple[int, int], scan_y: Tuple[int, int]) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        if coarse_scale is None:
+            return scan_x, scan_y
+        return shrink_window(scan_x, coarse_scale[0]), shrink_window(scan_y, coarse_scale[1])
+
+    def scan_axis(use_pyramid: bool, axis: str, *args) -> List[Tuple[int, int]]:
+        if coarse_scale is not None:
+            # 扫描区间与长度类参数按比例缩小，在小图上识别后把段换算回原图坐标
+            metric_name, threshold_value, auto, mode, axis_x, axis_y, merge, gap_min, min_len, expected = args
+            scale = coarse_scale[1] if axis == 'row' else coarse_scale[0]
+            segments = scan_axis_metric(
+                None,
+                axis,
+                metric_name,
+                threshold_value,
+                auto,
+                mode,
+                *decoded_window(axis_x, axis_y),
+                int(merge // scale),
+                max(1, int(gap_min // scale)),
+                max(1, int(min_len // scale)),
+                expected,
+                profiles,
+            )
+            return expand_segments(segments, scale, h if axis == 'row' else w)
+        if use_pyramid:
+            # max/mean/variance 用块均值：块最大值会把背景噪声抬过固定阈值，粗图上的空白带整段被判成内容；
+            # edge 用块最大值，块均值会抹平卡牌纹理的行间差异
+            pooling = 'max' if args[0].lower() == 'edge' else 'mean'
+            if pooling not in coarse_levels:
+                with timer.phase('pyramidLevel'):
+                    level = pyramid_level(pixels, pyramid, pooling)
+                coarse_levels[pooling] = ProfileCache(level, timer)
+            return scan_axis_pyramid(profiles, coarse_levels[pooling], pyramid, axis, *args)
+        return scan_axis_metric(None, axis, *args, profiles)
 
-    if col_scan_from_row is not None and row_segments:
-        if col_scan_from_row < 0:
-            target_index = max(range(len(row_segments)), key=lambda i: row_segments[i][1])
+    def detect(use_pyramid: bool) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]], Tuple[int, int]]:
+        # 行/列窗口在同一次条带遍历中算出全部指标；列窗口依赖行识别结果时再单独补算
+        if not use_pyramid:
+            profile_requests = []
+            if uniform_rows is None:
+                profile_requests.append(('row', *decoded_window(row_scan_x, row_scan_y), row_threshold))
+            if uniform_cols is None and col_scan_from_row is None:
+                profile_requests.append(('col', *decoded_window(col_scan_x, col_scan_y), col_threshold))
+            profiles.warm(profile_requests)
+
+        if uniform_rows is not None:
+            row_segments = build_uniform_segments(h, uniform_rows)
+        else:
+            row_segments = scan_axis(
+                use_pyramid,
+                'row',
+                row_metric,
+                row_threshold,
+                row_auto_threshold,
+                row_detect_mode,
+                row_scan_x,
+                row_scan_y,
+                row_gap_merge,
+                row_gap_min_segment,
+                row_min_segment,
+                expected_rows,
+            )
+
+        axis_col_scan_y = col_scan_y
+        if col_scan_from_row is not None and row_segments:
+            axis_col_scan_y = select_row_window(row_segments, col_scan_from_row)
+
+        if uniform_cols is not None:
+            col_segments = build_uniform_segments(w, uniform_cols)
         else:
-            target_index = min(col_scan_from_row, len(row_segments) - 1)
-        row_start, row_len = row_segments[target_index]
-        col_scan_y = (row_start, row_start + row_len)
+            col_segments = scan_axis(
+                use_pyramid,
+                'col',
+                col_metric,
+                col_threshold,
+                col_auto_threshold,
+                col_detect_mode,
+                col_scan_x,
+                axis_col_scan_y,
+                col_gap_merge,
+                col_gap_min_segment,
+                col_min_segment,
+                expected_cols,
+            )
+        return row_segments, col_segments, axis_col_scan_y
 
-    if uniform_cols is not None:
-        col_segments = build_uniform_segments(w, uniform_cols)
+    pyramid_info = None
+    ragged_segments = None
+    template_info = None
+    template_match = None
+    if template is not None:
+        with timer.phase('templateVerify'):
+            template_info, template_match = match_template(
+                profiles,
+                template,
+                h,
+                w,
+                (row_metric, row_threshold, row_auto_threshold, row_detect_mode, row_scan_x, row_scan_y,
+                 row_gap_merge, row_gap_min_segment, row_min_segment),
+                (col_metric, col_threshold, col_auto_threshold, col_detect_mode, col_scan_x, col_scan_y,
+                 col_gap_merge, col_gap_min_segment, col_min_segment),
+                uniform_rows is not None,
+                uniform_cols is not None,
+            )
+        if template_match is None:
+            messages.append(f"[info] 模板校验未通过（{template_info['reason']}），改为完整扫描")
+    if template_match is not None:
+        row_segments, col_segments, col_scan_y, ragged_segments = template_match
     else:
-        col_expected = expected_cols
-        col_segments = scan_axis_metric(
-            img,
-            'col',
-            col_metric,
-            col_threshold,
-            col_auto_threshold,
-            col_detect_mode,
-            col_scan_x,
-            col_scan_y,
-            col_gap_merge,
-            col_gap_min_segment,
-            col_min_segment,
-            col_expected,
-        )
+        started = time.perf_counter()
+        row_segments, col_segments, col_scan_y = detect(bool(pyramid))
+        elapsed = time.perf_counter() - started
+        if pyramid:
+            pyramid_info = {'factor': pyramid}
+            if pyramid_verify:
+                started = time.perf_counter()
+                full_rows, full_cols, _ = detect(False)
+                full_elapsed = time.perf_counter() - started
+
+                def max_delta(coarse: List[Tuple[int, int]], full: List[Tuple[int, int]], index: int) -> int | None:
+                    if len(coarse) != len(full):
+                        return None
+                    return max((abs(a[index] - b[index]) for a, b in zip(coarse, full)), default=0)
+
+                match = row_segments == full_rows and col_segments == full_cols
+                pyramid_info.update({
+                    'match': match,
+                    'fullRows': len(full_rows),
+                    'fullCols': len(full_cols),
+                    'maxRowStartDelta': max_delta(row_segments, full_rows, 0),
+                    'maxRowLengthDelta': max_delta(row_segments, full_rows, 1),
+                    'maxColStartDelta': max_delta(col_segments, full_cols, 0),
+                    'maxColLengthDelta': max_delta(col_segments, full_cols, 1),
+                    'seconds': round(elapsed, 4),
+                    'fullSeconds': round(full_elapsed, 4),
+                    'speedup': round(full_elapsed / elapsed, 2) if elapsed > 0 else None,
+                })
+                if not match:
+                    messages.append(
+                        f"[warn] 金字塔扫描与全分辨率结果不一致：行 {len(row_segments)}/{len(full_rows)}，"
+                        f"列 {len(col_segments)}/{len(full_cols)}"
+                    )
+
+        if ragged_cols and row_segments:
+            # 每个行段各自一个列窗口：一次条带遍历同时累加全部窗口，得到 行×列 指标矩阵后逐行切段；
+            # 各行段数不同，不套用预期列数
+            bands = [(start, start + length) for start, length in row_segments]
+            if not pyramid:
+                profiles.warm(('col', *decoded_window(col_scan_x, band), col_threshold) for band in bands)
+            ragged_segments = [
+                scan_axis(
+                    bool(pyramid),
+                    'col',
+                    col_metric,
+                    col_threshold,
+                    col_auto_threshold,
+                    col_detect_mode,
+                    col_scan_x,
+                    band,
+                    col_gap_merge,
+                    col_gap_min_segment,
+                    col_min_segment,
+                    None,
+                )
+                for band in bands
+            ]
 
     rows = len(row_segments)
     cols = len(col_segments)
     if expected_rows is not None and expected_rows != rows:
-        print(f"[warn] 预期行数={expected_rows}，实际识别行数={rows}")
+        messages.append(f"[warn] 预期行数={expected_rows}，实际识别行数={rows}")
     if expected_cols is not None and expected_cols != cols:
-        print(f"[warn] 预期列数={expected_cols}，实际识别列数={cols}")
+        messages.append(f"[warn] 预期列数={expected_cols}，实际识别列数={cols}")
 
     # 行高归一化：当某行高度明显偏小（<中位数70%）时，补齐到中位数
     # 典型场景：最后一行只有部分卡牌，大片空白导致扫描提前截断行高
     row_heights = [length for _, length in row_segments]
-    if len(row_heights) >= 2:
-        sorted_heights = sorted(row_heights)
-        median_height = sorted_heights[len(sorted_heights) // 2]
-        for i, h_val in enumerate(row_heights):
-            if h_val < median_height * 0.7:
-                # 补齐到中位数，但不超过图片边界
-                start = row_segments[i][0]
-                max_possible = h - start
-                new_height = min(median_height, max_possible)
-                row_segments[i] = (start, new_height)
-                print(f"[info] 行{i}高度{h_val}偏小（中位数{median_height}），已补齐到{new_height}")
+    with timer.phase('normalization'):
+        if len(row_heights) >= 2:
+            sorted_heights = sorted(row_heights)
+            median_height = sorted_heights[len(sorted_heights) // 2]
+            for i, h_val in enumerate(row_heights):
+                if h_val < median_height * 0.7:
+                    # 补齐到中位数，但不超过图片边界
+                    start = row_segments[i][0]
+                    max_possible = h - start
+                    new_height = min(median_height, max_possible)
+                    row_segments[i] = (start, new_height)
+                    messages.append(f"[info] 行{i}高度{h_val}偏小（中位数{median_height}），已补齐到{new_height}")
 
-    return {
+    scan['colScanYStart'] = col_scan_y[0]
+    scan['colScanYEnd'] = col_scan_y[1]
+    config = {
         'imageW': w,
         'imageH': h,
         'rows': rows,
@@ -400,54 +1959,117 @@ def build_config(
         'rowHeights': [length for _, length in row_segments],
         'colStarts': [start for start, _ in col_segments],
         'colWidths': [length for _, length in col_segments],
-        'scan': {
-            'metric': metric,
-            'threshold': threshold,
-            'autoThreshold': auto_threshold,
-            'rowMetric': row_metric,
-            'colMetric': col_metric,
-            'rowThreshold': row_threshold,
-            'colThreshold': col_threshold,
-            'rowAutoThreshold': row_auto_threshold,
-            'colAutoThreshold': col_auto_threshold,
-            'gapMerge': gap_merge,
-            'minSegment': min_segment,
-            'rowGapMerge': row_gap_merge,
-            'colGapMerge': col_gap_merge,
-            'rowMinSegment': row_min_segment,
-            'colMinSegment': col_min_segment,
-            'rowDetectMode': row_detect_mode,
-            'colDetectMode': col_detect_mode,
-            'rowGapMinSegment': row_gap_min_segment,
-            'colGapMinSegment': col_gap_min_segment,
-            'uniformRows': uniform_rows,
-            'uniformCols': uniform_cols,
-            'scanXStart': scan_x[0],
-            'scanXEnd': scan_x[1],
-            'scanYStart': scan_y[0],
-            'scanYEnd': scan_y[1],
-            'rowScanXStart': row_scan_x[0],
-            'rowScanXEnd': row_scan_x[1],
-            'rowScanYStart': row_scan_y[0],
-            'rowScanYEnd': row_scan_y[1],
-            'colScanXStart': col_scan_x[0],
-            'colScanXEnd': col_scan_x[1],
-            'colScanYStart': col_scan_y[0],
-            'colScanYEnd': col_scan_y[1],
-            'colScanFromRow': col_scan_from_row,
-        },
     }
+    if ragged_segments is not None:
+        config['rowColCounts'] = [len(segments) for segments in ragged_segments]
+        config['rowColStarts'] = [[start for start, _ in segments] for segments in ragged_segments]
+        config['rowColWidths'] = [[length for _, length in segments] for segments in ragged_segments]
+    config['scan'] = scan
+    if pyramid_info is not None:
+        config['pyramid'] = pyramid_info
+    if template_info is not None:
+        config['template'] = template_info
+    if coarse_scale is not None:
+        config['coarseDecode'] = {
+            'factor': coarse_decode,
+            'decodedW': profiles.width,
+            'decodedH': profiles.height,
+        }
+    for message in messages:
+        report(notes, message)
+    if cache is not None:
+        cache.put(cache_key, {'config': config, 'notes': messages})
+    return attach_timings(config, False)
 
 
-def main() -> None:
-    if len(sys.argv) == 4 and not sys.argv[1].startswith('-'):
-        analyze_grid(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
-        return
+def config_cells(config: dict) -> List[Tuple[int, int, Tuple[int, int, int, int]]]:
+    """配置中的全部格子 (行, 列, (left, upper, right, lower))，逐行列段优先于统一列段。"""
+    cells = []
+    for row, (y, height) in enumerate(zip(config['rowStarts'], config['rowHeights'])):
+        if 'rowColStarts' in config:
+            columns = zip(config['rowColStarts'][row], config['rowColWidths'][row])
+        else:
+            columns = zip(config['colStarts'], config['colWidths'])
+        for col, (x, width) in enumerate(columns):
+            cells.append((row, col, (x, y, x + width, y + height)))
+    return cells
+
 
+def slice_cells(
+    image_path: str,
+    config: dict,
+    out_dir: str,
+    image_format: str = 'png',
+    workers: int | None = None,
+    keep_empty: bool = False,
+) -> dict:
+    """按配置把每个格子裁成单独的文件：整图只解码一次，裁切与编码在线程池里并行（Pillow 编码时释放 GIL）。
+
+    空格（与网格诊断相同的中心区域平均亮度判定，通道取配置的 scan.channel）默认跳过。
+    在输出目录写 index.json：{"cells": {格子编号: {file, row, col, x, y, w, h}}, "skipped": [...]}，
+    格子编号按行优先从 0 递增，跳过的空格也占编号。
+    """
+    if image_format not in SLICE_FORMATS:
+        raise ValueError(f"Unsupported slice format: {image_format}")
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    stem = Path(image_path).stem
+    with Image.open(image_path) as img:
+        img.load()
+        if (img.width, img.height) != (config['imageW'], config['imageH']):
+            raise ValueError(
+                f"Config size {config['imageW']}x{config['imageH']} does not match image {img.width}x{img.height}"
+            )
+        channel = config.get('scan', {}).get('channel', 'luminance')
+        integral = IntegralImage(channel_array(img, channel))
+        if img.mode == 'P' or (image_format == 'webp' and img.mode not in {'RGB', 'RGBA', 'L'}):
+            img = img.convert('RGBA')
+
+        cells = config_cells(config)
+        digits = max(3, len(str(len(cells) - 1)))
+
+        def save(index: int, box: Tuple[int, int, int, int]) -> str:
+            filename = f"{stem}_{index:0{digits}d}.{image_format}"
+            save_kwargs = {'quality': WEBP_QUALITY, 'method': 6} if image_format == 'webp' else {}
+            img.crop(box).save(out / filename, **save_kwargs)
+            return filename
+
+        index = {'image': image_path, 'format': image_format, 'cells': {}, 'skipped': []}
+        with ThreadPoolExecutor(max_workers=max(1, workers or os.cpu_count() or 1)) as executor:
+            futures = {}
+            for cell_id, (row, col, box) in enumerate(cells):
+                if not keep_empty and integral.rect_mean(cell_center_box(box)) < EMPTY_CELL_MEAN:
+                    index['skipped'].append(str(cell_id))
+                    continue
+                futures[executor.submit(save, cell_id, box)] = (cell_id, row, col, box)
+            for future in as_completed(futures):
+                cell_id, row, col, (x0, y0, x1, y1) = futures[future]
+                index['cells'][str(cell_id)] = {
+                    'file': future.result(),
+                    'row': row,
+                    'col': col,
+                    'x': x0,
+                    'y': y0,
+                    'w': x1 - x0,
+                    'h': y1 - y0,
+                }
+    index['cells'] = dict(sorted(index['cells'].items(), key=lambda item: int(item[0])))
+    with open(out / 'index.json', 'w', encoding='utf-8') as f:
+        f.write(json.dumps(index, ensure_ascii=False, indent=2))
+    return index
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description='扫描图集网格并输出 row/col 配置')
-    parser.add_argument('--image', required=True, help='图片路径')
+    parser.add_argument('--image', help='图片路径')
     parser.add_argument('--metric', default='max', help='扫描指标: max | mean | variance')
     parser.add_argument('--threshold', type=float, default=20, help='阈值 (亮度/均值/方差)')
+    parser.add_argument(
+        '--channel',
+        choices=SCAN_CHANNELS,
+        default='luminance',
+        help='扫描通道: luminance=灰度 | alpha=不透明度（透明精灵图）| max-rgb=RGB 取最大',
+    )
     parser.add_argument('--auto-threshold', type=float, help='自动阈值比例 (0-1)')
     parser.add_argument('--row-metric', help='行扫描指标 (覆盖 metric)')
     parser.add_argument('--col-metric', help='列扫描指标 (覆盖 metric)')
@@ -467,6 +2089,11 @@ def main() -> None:
     parser.add_argument('--col-gap-min-segment', type=int, help='列扫描间隙最小长度 (detect-mode=gap)')
     parser.add_argument('--uniform-rows', type=int, help='强制均分行数（覆盖扫描）')
     parser.add_argument('--uniform-cols', type=int, help='强制均分列数（覆盖扫描）')
+    parser.add_argument(
+        '--ragged-cols',
+        action='store_true',
+        help='逐行识别列：每个行段单独切列，输出 rowColCounts/rowColStarts/rowColWidths（各行列数可不同）',
+    )
     parser.add_argument('--scan-x-start', type=int, default=0, help='扫描 X 起始')
     parser.add_argument('--scan-x-end', type=int, default=-1, help='扫描 X 结束 (<=0 表示全宽)')
     parser.add_argument('--scan-y-start', type=int, default=0, help='扫描 Y 起始')
@@ -480,77 +2107,735 @@ def main() -> None:
     parser.add_argument('--col-scan-y-start', type=int, help='列扫描 Y 起始')
     parser.add_argument('--col-scan-y-end', type=int, help='列扫描 Y 结束')
     parser.add_argument('--col-scan-from-row', type=int, help='列扫描使用指定行段 (-1=最长行)')
-    parser.add_argument('--expected-rows', type=int, help='预期行数（仅提示）')
-    parser.add_argument('--expected-cols', type=int, help='预期列数（仅提示）')
+    parser.add_argument('--expected-rows', type=int, help='预期行数（段数不符时按段数曲线求解阈值）')
+    parser.add_argument('--expected-cols', type=int, help='预期列数（段数不符时按段数曲线求解阈值）')
+    parser.add_argument('--stream', action='store_true', help='流式扫描：PNG 按水平条带解码并累加行/列曲线，不持有整图')
+    parser.add_argument(
+        '--memory-budget-mb',
+        type=float,
+        default=DEFAULT_MEMORY_BUDGET_MB,
+        help='流式扫描峰值内存预算 (MB)，决定条带行数',
+    )
+    parser.add_argument(
+        '--pyramid',
+        type=int,
+        choices=PYRAMID_FACTORS,
+        help='金字塔扫描：先在缩小 N 倍的图上识别，再在边界附近全分辨率精修',
+    )
+    parser.add_argument(
+        '--coarse-decode',
+        type=int,
+        choices=COARSE_DECODE_FACTORS,
+        help='低分辨率快速扫描：按 1/N 分辨率解码（JPEG 直接在 DCT 阶段缩小），识别结果换算回原图坐标',
+    )
+    parser.add_argument('--pyramid-verify', action='store_true', help='金字塔扫描后再做一次全分辨率扫描，输出差异与耗时对比')
+    parser.add_argument(
+        '--timings',
+        action='store_true',
+        help='记录各阶段耗时（解码/灰度/行列曲线/阈值搜索/分段/行高归一化）与峰值内存，写入输出 JSON 的 timings 块',
+    )
+    parser.add_argument(
+        '--template',
+        help='模板配置 JSON：只采样模板间隙与边界校验新图，一致时直接沿用模板行列，不一致再完整扫描（扫描参数取自模板）',
+    )
+    parser.add_argument(
+        '--pixel-cache',
+        action='store_true',
+        help='解码像素缓存：把解码后的灰度平面存到磁盘（按文件哈希），之后的扫描以内存映射读入、跳过解码'
+        '（也可设置环境变量 ATLAS_SCAN_PIXEL_CACHE=1）',
+    )
+    parser.add_argument(
+        '--variants',
+        action='store_true',
+        help='同时为 compress_images 生成的缩放变体（compressed/<名称>.webp，长边上限 IMAGE_MAX_EDGE）'
+        '按比例派生配置并做边界校验，写到 compressed/<名称>.atlas.json',
+    )
     parser.add_argument('--output', help='写入 JSON 文件')
+    parser.add_argument(
+        '--slice',
+        metavar='DIR',
+        help='切图模式：按识别结果把每个格子裁成单独文件写到 DIR（跳过空格），并写 DIR/index.json',
+    )
+    parser.add_argument('--slice-format', choices=SLICE_FORMATS, default='png', help='切图输出格式')
+    parser.add_argument('--slice-keep-empty', action='store_true', help='切图时不跳过空格')
     parser.add_argument('--pretty', action='store_true', help='格式化输出 JSON')
-    args = parser.parse_args()
+    parser.add_argument('--batch', help='批量模式：按清单 JSON 扫描多张图集（进程池并行）')
+    parser.add_argument('--workers', type=int, help='批量模式进程数（默认 CPU 核数）')
+    parser.add_argument('--summary', help='批量模式汇总 JSON 输出路径（默认打印到控制台）')
+    parser.add_argument('--no-cache', action='store_true', help='不读写扫描结果缓存（强制重新扫描）')
+    parser.add_argument(
+        '--autotune',
+        action='store_true',
+        help='自动调参：按 --expected-rows/--expected-cols 并行搜索指标/检测模式/合并间距/最小段长/扫描区间',
+    )
+    parser.add_argument('--autotune-top', type=int, default=10, help='自动调参排名表显示的候选数')
+    parser.add_argument(
+        '--worker',
+        action='store_true',
+        help='常驻模式：从 stdin 逐行读取 JSON 扫描请求，逐行输出 JSON 结果（供 atlas_grid_scan.js 复用进程）',
+    )
+    parser.add_argument(
+        '--worker-cache-mb',
+        type=float,
+        default=DEFAULT_WORKER_CACHE_MB,
+        help='常驻模式缓存解码灰度图的内存上限 (MB)',
+    )
+    return parser
 
-    row_scan_x = None
-    row_scan_y = None
-    col_scan_x = None
-    col_scan_y = None
-    if args.row_scan_x_start is not None or args.row_scan_x_end is not None:
-        row_scan_x = (
-            args.row_scan_x_start or 0,
-            args.row_scan_x_end or -1,
-        )
-    if args.row_scan_y_start is not None or args.row_scan_y_end is not None:
-        row_scan_y = (
-            args.row_scan_y_start or 0,
-            args.row_scan_y_end or -1,
-        )
-    if args.col_scan_x_start is not None or args.col_scan_x_end is not None:
-        col_scan_x = (
-            args.col_scan_x_start or 0,
-            args.col_scan_x_end or -1,
+
+# 仅对整次运行生效、不属于单张图扫描参数的选项
+RUN_OPTIONS = {
+    'batch', 'workers', 'summary', 'pretty', 'no_cache', 'autotune', 'autotune_top', 'worker', 'worker_cache_mb',
+    'slice', 'slice_format', 'slice_keep_empty',
+}
+
+
+def resolve_window_arg(start: int | None, end: int | None) -> Tuple[int, int] | None:
+    if start is None and end is None:
+        return None
+    return (start or 0, end or -1)
+
+
+def build_config_from_options(
+    options: dict,
+    notes: List[str] | None = None,
+    cache: ScanResultCache | None = None,
+    profiles: ProfileCache | None = None,
+    images: DecodedImageCache | None = None,
+) -> dict:
+    """按命令行参数名（argparse dest）调用 build_config，命令行与批量清单共用。"""
+    template = None
+    if options['template']:
+        template = load_template(options['template'])
+        options = {**options, **template_scan_options(template, options)}
+    return build_config(
+        options['image'],
+        options['metric'],
+        options['threshold'],
+        options['auto_threshold'],
+        options['row_metric'],
+        options['col_metric'],
+        options['row_threshold'],
+        options['col_threshold'],
+        options['row_auto_threshold'],
+        options['col_auto_threshold'],
+        options['row_gap_merge'],
+        options['col_gap_merge'],
+        options['row_min_segment'],
+        options['col_min_segment'],
+        options['row_detect_mode'],
+        options['col_detect_mode'],
+        options['row_gap_min_segment'],
+        options['col_gap_min_segment'],
+        options['uniform_rows'],
+        options['uniform_cols'],
+        options['gap_merge'],
+        options['min_segment'],
+        (options['scan_x_start'], options['scan_x_end']),
+        (options['scan_y_start'], options['scan_y_end']),
+        resolve_window_arg(options['row_scan_x_start'], options['row_scan_x_end']),
+        resolve_window_arg(options['row_scan_y_start'], options['row_scan_y_end']),
+        resolve_window_arg(options['col_scan_x_start'], options['col_scan_x_end']),
+        resolve_window_arg(options['col_scan_y_start'], options['col_scan_y_end']),
+        options['col_scan_from_row'],
+        options['expected_rows'],
+        options['expected_cols'],
+        notes=notes,
+        cache=cache,
+        memory_budget_mb=options['memory_budget_mb'] if options['stream'] else None,
+        pyramid=options['pyramid'],
+        pyramid_verify=options['pyramid_verify'],
+        profiles=profiles,
+        timings=options['timings'],
+        images=images,
+        coarse_decode=options['coarse_decode'],
+        channel=options['channel'],
+        ragged_cols=options['ragged_cols'],
+        template=template,
+        pixel_cache=pixel_cache_for(options),
+    )
+
+
+def pixel_cache_for(options: dict) -> DecodedPixelCache | None:
+    return DecodedPixelCache() if options['pixel_cache'] or PIXEL_CACHE_ENABLED else None
+
+
+def attach_variants(config: dict, options: dict, notes: List[str] | None, pretty: bool) -> dict:
+    """--variants：写出缩放变体的派生配置，并在源配置末尾附上各变体摘要（不进结果缓存，变体可能在扫描后才生成）。"""
+    if options['variants']:
+        config['variants'] = emit_variant_configs(config, options['image'], pretty, notes, pixel_cache_for(options))
+    return config
+
+
+def write_config(config: dict, path: str, pretty: bool) -> None:
+    indent = 2 if pretty else None
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(config, ensure_ascii=False, indent=indent))
+
+
+def default_scan_options(parser: argparse.ArgumentParser) -> dict:
+    """命令行默认值中属于单张图扫描参数的部分（批量清单与常驻进程请求共用）。"""
+    base = vars(parser.parse_args([]))
+    for key in RUN_OPTIONS:
+        base.pop(key, None)
+    return base
+
+
+def scan_option_types(parser: argparse.ArgumentParser) -> Dict[str, type]:
+    return {action.dest: action.type for action in parser._actions if action.type is not None}
+
+
+def normalize_options(entry: dict, base: dict, where: str, types: Dict[str, type] | None = None) -> dict:
+    """把清单/请求里的键（"auto-threshold" / "auto_threshold"）换成 argparse dest，拒绝未知参数。
+
+    给出 types 时按命令行参数类型转换取值（如阈值 12 -> 12.0），输出与缓存键与命令行调用一致。
+    """
+    options = {}
+    for key, value in entry.items():
+        dest = key.lstrip('-').replace('-', '_')
+        if dest not in base:
+            raise ValueError(f"{where} 存在未知参数: {key}")
+        if types and value is not None and dest in types:
+            value = types[dest](value)
+        options[dest] = value
+    return options
+
+
+def load_batch_jobs(manifest_path: str, parser: argparse.ArgumentParser) -> List[dict]:
+    """读取批量清单。
+
+    清单为 {"defaults": {...}, "jobs": [{...}, ...]}（或直接是 jobs 数组），
+    每项的键与命令行参数同名（如 "auto-threshold" / "auto_threshold"），
+    未给出的参数取 defaults，再取命令行默认值；"output" 缺省为图片同目录的 <name>.atlas.json。
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+
+    base = default_scan_options(parser)
+    types = scan_option_types(parser)
+    defaults = normalize_options(manifest.get('defaults', {}), base, 'defaults', types)
+    jobs: List[dict] = []
+    for index, entry in enumerate(manifest.get('jobs', [])):
+        options = {**base, **defaults, **normalize_options(entry, base, f"jobs[{index}]", types)}
+        if not options['image']:
+            raise ValueError(f"jobs[{index}] 缺少 image")
+        if not options['output']:
+            image = Path(options['image'])
+            options['output'] = str(image.with_name(f"{image.stem}.atlas.json"))
+        jobs.append(options)
+    return jobs
+
+
+def run_batch_job(options: dict, pretty: bool, use_cache: bool) -> dict:
+    """批量模式的单个任务（在子进程中执行）：扫描、写出配置并返回耗时与提示信息。"""
+    notes: List[str] = []
+    cache = ScanResultCache() if use_cache else None
+    started = time.perf_counter()
+    result = {'image': options['image'], 'output': options['output']}
+    try:
+        config = attach_variants(build_config_from_options(options, notes, cache), options, notes, pretty)
+        write_config(config, options['output'], pretty)
+        result.update({'ok': True, 'rows': config['rows'], 'cols': config['cols']})
+        if 'timings' in config:
+            result['rowMetric'] = config['scan']['rowMetric']
+            result['colMetric'] = config['scan']['colMetric']
+            result['timings'] = config['timings']
+    except Exception as exc:
+        result.update({'ok': False, 'error': f"{type(exc).__name__}: {exc}"})
+    result['seconds'] = round(time.perf_counter() - started, 4)
+    if cache is None:
+        result['cache'] = 'off'
+    else:
+        result['cache'] = 'hit' if cache.hits else ('miss' if cache.misses else None)
+    result['warnings'] = notes
+    return result
+
+
+def summarize_batch_timings(results: List[dict | None]) -> dict | None:
+    """汇总各任务的阶段耗时：按阶段、按行/列指标累计，并列出最慢的几张图集。"""
+    timed = [result for result in results if result and 'timings' in result]
+    if not timed:
+        return None
+    phases: Dict[str, float] = {}
+    by_metric: Dict[str, float] = {}
+    for result in timed:
+        for name, seconds in result['timings']['phases'].items():
+            phases[name] = phases.get(name, 0.0) + seconds
+        for axis in ('row', 'col'):
+            # 每个轴的曲线计算与阈值/分段耗时无法逐项拆开，按轴的曲线阶段计入对应指标
+            metric = result[f'{axis}Metric']
+            by_metric[metric] = by_metric.get(metric, 0.0) + result['timings']['phases'].get(f'{axis}Profile', 0.0)
+    slowest = sorted(timed, key=lambda result: result['timings']['totalSeconds'], reverse=True)[:5]
+    return {
+        'jobs': len(timed),
+        'phases': {name: round(seconds, 4) for name, seconds in sorted(phases.items(), key=lambda item: -item[1])},
+        'profileSecondsByMetric': {metric: round(seconds, 4) for metric, seconds in by_metric.items()},
+        'peakRssMB': max((result['timings']['peakRssMB'] or 0 for result in timed), default=None),
+        'slowest': [
+            {'image': result['image'], 'totalSeconds': result['timings']['totalSeconds']}
+            for result in slowest
+        ],
+    }
+
+
+def run_batch(
+    manifest_path: str,
+    parser: argparse.ArgumentParser,
+    workers: int | None,
+    summary_path: str | None,
+    pretty: bool,
+    use_cache: bool,
+) -> int:
+    jobs = load_batch_jobs(manifest_path, parser)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs) or 1))
+    started = time.perf_counter()
+    results: List[dict | None] = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_batch_job, job, pretty, use_cache): index for index, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            status = '完成' if result['ok'] else '失败'
+            cached = '，缓存命中' if result['cache'] == 'hit' else ''
+            print(f"[batch] {status} {result['image']} ({result['seconds']:.2f}s{cached})", file=sys.stderr)
+            for note in result['warnings']:
+                print(f"[batch]   {note}", file=sys.stderr)
+
+    failed = sum(1 for result in results if result and not result['ok'])
+    summary = {
+        'manifest': manifest_path,
+        'workers': workers,
+        'total': len(jobs),
+        'failed': failed,
+        'seconds': round(time.perf_counter() - started, 4),
+        'cache': {
+            'hits': sum(1 for result in results if result and result['cache'] == 'hit'),
+            'misses': sum(1 for result in results if result and result['cache'] == 'miss'),
+        },
+        'jobs': results,
+    }
+    timings = summarize_batch_timings(results)
+    if timings is not None:
+        summary['timings'] = timings
+    output = json.dumps(summary, ensure_ascii=False, indent=2)
+    if summary_path:
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"[batch] 汇总已写入 {summary_path}", file=sys.stderr)
+    else:
+        print(output)
+    return 1 if failed else 0
+
+
+# 自动调参的搜索空间：每个轴按 指标 × 检测模式 × 合并间距 × 最小段长 × 自动阈值 × 扫描区间 组合
+AUTOTUNE_DETECT_MODES = ('content', 'gap')
+AUTOTUNE_GAP_MERGES = (0, 2, 5, 10)
+AUTOTUNE_MIN_SEGMENTS = (5, 20, 50)
+AUTOTUNE_AUTO_THRESHOLDS = (None, 0.1, 0.2, 0.3)
+# 段长偏离中位数超过该比例即视为不规整（同一图集的卡牌尺寸应一致）
+AUTOTUNE_LENGTH_TOLERANCE = 0.1
+# 每个进程分到的任务块数：块越小提前结束越及时，块越大进程间传输越少
+AUTOTUNE_CHUNKS_PER_WORKER = 4
+
+
+def axis_options(options: dict, axis: str) -> dict:
+    """按 build_config 的回退规则取出某一轴实际使用的扫描参数。"""
+    def pick(name: str, fallback):
+        value = options[f'{axis}_{name}']
+        return fallback if value is None else value
+
+    return {
+        'metric': resolve_metric(options[f'{axis}_metric'], options['metric']).lower(),
+        'threshold': resolve_number(options[f'{axis}_threshold'], options['threshold']),
+        'auto_threshold': resolve_number(options[f'{axis}_auto_threshold'], options['auto_threshold']),
+        'detect_mode': (options[f'{axis}_detect_mode'] or 'content').lower(),
+        'gap_merge': pick('gap_merge', options['gap_merge']),
+        'gap_min_segment': pick('gap_min_segment', 1),
+        'min_segment': pick('min_segment', options['min_segment']),
+        'scan_x': resolve_window_arg(options[f'{axis}_scan_x_start'], options[f'{axis}_scan_x_end'])
+        or (options['scan_x_start'], options['scan_x_end']),
+        'scan_y': resolve_window_arg(options[f'{axis}_scan_y_start'], options[f'{axis}_scan_y_end'])
+        or (options['scan_y_start'], options['scan_y_end']),
+    }
+
+
+def autotune_candidates(base: dict, windows: List[Tuple[dict, Tuple[int, int], Tuple[int, int]]]) -> List[dict]:
+    """生成候选参数，当前参数排在最前（常常已经接近正确，便于尽早命中完全匹配）。
+
+    windows 为 (窗口参数, scan_x, scan_y)，窗口参数原样记录在候选里，用于回写命令行参数。
+    """
+    candidates = [dict(base, window=windows[0][0])]
+    seen = set()
+    grid = itertools.product(
+        windows,
+        PROFILE_METRICS,
+        AUTOTUNE_DETECT_MODES,
+        AUTOTUNE_GAP_MERGES,
+        AUTOTUNE_MIN_SEGMENTS,
+        AUTOTUNE_AUTO_THRESHOLDS,
+    )
+    for (window, scan_x, scan_y), metric, detect_mode, gap_merge, min_segment, auto_threshold in grid:
+        candidates.append(dict(
+            base,
+            window=window,
+            scan_x=scan_x,
+            scan_y=scan_y,
+            metric=metric,
+            detect_mode=detect_mode,
+            gap_merge=gap_merge,
+            min_segment=min_segment,
+            auto_threshold=auto_threshold,
+        ))
+    unique = []
+    for candidate in candidates:
+        signature = json.dumps(candidate, sort_keys=True)
+        if signature not in seen:
+            seen.add(signature)
+            unique.append(candidate)
+    return unique
+
+
+def score_segments(segments: List[Tuple[int, int]], expected: int, axis: str) -> Tuple[int, int]:
+    """返回 (段数偏差, 不规整段数)，两者都为 0 即完全匹配。"""
+    lengths = [length for _, length in segments]
+    if axis == 'row' and len(lengths) > 1:
+        # 最后一行可能只排了部分卡牌，build_config 会按中位数补齐行高
+        lengths = lengths[:-1]
+    irregular = 0
+    if lengths:
+        median = sorted(lengths)[len(lengths) // 2]
+        irregular = sum(1 for length in lengths if abs(length - median) > median * AUTOTUNE_LENGTH_TOLERANCE)
+    return abs(len(segments) - expected), irregular
+
+
+def evaluate_autotune_chunk(curves: dict, axis: str, expected: int, chunk: List[Tuple[int, dict]]) -> List[dict]:
+    """自动调参的单个任务块（在子进程中执行），只用预先算好的曲线，不接触图像。"""
+    profiles = ProfileCache.from_curves(curves)
+    results = []
+    for index, candidate in chunk:
+        resolved: Dict[str, float] = {}
+        segments = scan_axis_metric(
+            None,
+            axis,
+            candidate['metric'],
+            candidate['threshold'],
+            candidate['auto_threshold'],
+            candidate['detect_mode'],
+            candidate['scan_x'],
+            candidate['scan_y'],
+            candidate['gap_merge'],
+            candidate['gap_min_segment'],
+            candidate['min_segment'],
+            expected,
+            profiles,
+            resolved,
         )
-    if args.col_scan_y_start is not None or args.col_scan_y_end is not None:
-        col_scan_y = (
-            args.col_scan_y_start or 0,
-            args.col_scan_y_end or -1,
+        delta, irregular = score_segments(segments, expected, axis)
+        results.append({
+            'index': index,
+            'candidate': candidate,
+            'count': len(segments),
+            'delta': delta,
+            'irregular': irregular,
+            'resolvedThreshold': resolved.get('threshold'),
+            'perfect': delta == 0 and irregular == 0,
+        })
+    return results
+
+
+def autotune_axis(
+    profiles: ProfileCache,
+    axis: str,
+    expected: int,
+    candidates: List[dict],
+    workers: int,
+) -> dict:
+    """并行评估一个轴的全部候选，出现完全匹配即取消剩余任务。
+
+    任务块按提交顺序收取结果：只有编号更小的块都已完成、且其中出现完全匹配时才提前停止，
+    因此参与排序的结果集合与串行路径一致，workers 取任何值都选出同一组参数。
+    """
+    profiles.warm((axis, c['scan_x'], c['scan_y'], c['threshold']) for c in candidates)
+    curves = profiles.export_curves()
+    indexed = list(enumerate(candidates))
+    chunk_count = max(1, workers * AUTOTUNE_CHUNKS_PER_WORKER)
+    chunk_size = max(1, math.ceil(len(indexed) / chunk_count))
+    chunks = [indexed[i:i + chunk_size] for i in range(0, len(indexed), chunk_size)]
+
+    started = time.perf_counter()
+    results: List[dict] = []
+    if workers <= 1:
+        for chunk in chunks:
+            results.extend(evaluate_autotune_chunk(curves, axis, expected, chunk))
+            if any(result['perfect'] for result in results):
+                break
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = [pool.submit(evaluate_autotune_chunk, curves, axis, expected, chunk) for chunk in chunks]
+            # 不用 as_completed：按完成先后停止会让结果取决于进程调度
+            for future in futures:
+                results.extend(future.result())
+                if any(result['perfect'] for result in results):
+                    break
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    results.sort(key=lambda result: (result['delta'], result['irregular'], result['index']))
+    return {
+        'axis': axis,
+        'expected': expected,
+        'candidates': len(candidates),
+        'evaluated': len(results),
+        'perfect': bool(results) and results[0]['perfect'],
+        'seconds': round(time.perf_counter() - started, 4),
+        'ranked': results,
+    }
+
+
+def apply_axis_candidate(options: dict, axis: str, candidate: dict) -> None:
+    """把候选参数写回命令行参数（argparse dest），最终配置仍由 build_config 生成。"""
+    options[f'{axis}_metric'] = candidate['metric']
+    options[f'{axis}_threshold'] = candidate['threshold']
+    options[f'{axis}_auto_threshold'] = candidate['auto_threshold']
+    options[f'{axis}_detect_mode'] = candidate['detect_mode']
+    options[f'{axis}_gap_merge'] = candidate['gap_merge']
+    options[f'{axis}_gap_min_segment'] = candidate['gap_min_segment']
+    options[f'{axis}_min_segment'] = candidate['min_segment']
+    if axis == 'col':
+        options['col_scan_from_row'] = candidate['window'].get('col_scan_from_row')
+
+
+def format_autotune_table(tuned: dict, top: int) -> List[str]:
+    label = '行' if tuned['axis'] == 'row' else '列'
+    lines = [
+        f"[autotune] {label}: 预期 {tuned['expected']}，评估 {tuned['evaluated']}/{tuned['candidates']} 组参数，"
+        f"耗时 {tuned['seconds']:.2f}s，完全匹配: {'是' if tuned['perfect'] else '否'}",
+        # 表头用英文列名，中文全角字符会打乱等宽对齐
+        f"{'#':>4} {'count':>5} {'delta':>5} {'irreg':>5} {'metric':<8} {'mode':<7} {'threshold':>10} {'auto':>5} "
+        f"{'merge':>5} {'minSeg':>6} window",
+    ]
+    for rank, result in enumerate(tuned['ranked'][:top], start=1):
+        candidate = result['candidate']
+        threshold = result['resolvedThreshold']
+        auto = '-' if candidate['auto_threshold'] is None else f"{candidate['auto_threshold']:g}"
+        window = ', '.join(f"{key}={value}" for key, value in candidate['window'].items()) or 'scan'
+        lines.append(
+            f"{rank:>4} {result['count']:>5} {result['delta']:>5} {result['irregular']:>5} "
+            f"{candidate['metric']:<8} {candidate['detect_mode']:<7} "
+            f"{'-' if threshold is None else f'{threshold:.4g}':>10} {auto:>5} "
+            f"{candidate['gap_merge']:>5} {candidate['min_segment']:>6} {window}"
         )
+    return lines
 
-    config = build_config(
-        args.image,
-        args.metric,
-        args.threshold,
-        args.auto_threshold,
-        args.row_metric,
-        args.col_metric,
-        args.row_threshold,
-        args.col_threshold,
-        args.row_auto_threshold,
-        args.col_auto_threshold,
-        args.row_gap_merge,
-        args.col_gap_merge,
-        args.row_min_segment,
-        args.col_min_segment,
-        args.row_detect_mode,
-        args.col_detect_mode,
-        args.row_gap_min_segment,
-        args.col_gap_min_segment,
-        args.uniform_rows,
-        args.uniform_cols,
-        args.gap_merge,
-        args.min_segment,
-        (args.scan_x_start, args.scan_x_end),
-        (args.scan_y_start, args.scan_y_end),
-        row_scan_x,
-        row_scan_y,
-        col_scan_x,
-        col_scan_y,
-        args.col_scan_from_row,
-        args.expected_rows,
-        args.expected_cols,
-    )
+
+def autotune_cli_args(options: dict, axes: Iterable[str]) -> str:
+    parts = []
+    for axis in axes:
+        for name in ('metric', 'detect_mode', 'threshold', 'auto_threshold', 'gap_merge', 'min_segment'):
+            value = options[f'{axis}_{name}']
+            if value is not None:
+                flag = f"--{axis}-{name.replace('_', '-')}"
+                parts.append(f"{flag} {value:g}" if isinstance(value, float) else f"{flag} {value}")
+    if 'col' in axes and options['col_scan_from_row'] is not None:
+        parts.append(f"--col-scan-from-row {options['col_scan_from_row']}")
+    # 表中的阈值由预期段数求解得出，复现时需带上预期行/列数
+    for axis in axes:
+        name = 'rows' if axis == 'row' else 'cols'
+        parts.append(f"--expected-{name} {options[f'expected_{name}']}")
+    return ' '.join(parts)
+
+
+def run_autotune(options: dict, workers: int | None, top: int) -> dict:
+    """自动调参：整图只解码一次，行/列曲线在父进程算好后分发给进程池，逐轴搜索参数。
+
+    行先于列搜索：列扫描区间可以取自行识别结果（col-scan-from-row），需要用行的最佳结果来生成列候选。
+    """
+    options = dict(options)
+    expected = {'row': options['expected_rows'], 'col': options['expected_cols']}
+    workers = max(1, workers or os.cpu_count() or 1)
+    profiles = ProfileCache(load_pixels(options['image'], channel=options['channel'], pixel_cache=pixel_cache_for(options)))
+    summary = {}
+
+    tuned_axes = []
+    if expected['row'] is not None and options['uniform_rows'] is None:
+        base = axis_options(options, 'row')
+        windows = [({}, base['scan_x'], base['scan_y'])]
+        tuned = autotune_axis(profiles, 'row', expected['row'], autotune_candidates(base, windows), workers)
+        for line in format_autotune_table(tuned, top):
+            print(line, file=sys.stderr)
+        if tuned['ranked']:
+            apply_axis_candidate(options, 'row', tuned['ranked'][0]['candidate'])
+            tuned_axes.append('row')
+        summary['rows'] = tuned
+
+    if expected['col'] is not None and options['uniform_cols'] is None:
+        if options['uniform_rows'] is not None:
+            row_segments = build_uniform_segments(profiles.height, options['uniform_rows'])
+        else:
+            row = axis_options(options, 'row')
+            row_segments = scan_axis_metric(
+                None,
+                'row',
+                row['metric'],
+                row['threshold'],
+                row['auto_threshold'],
+                row['detect_mode'],
+                row['scan_x'],
+                row['scan_y'],
+                row['gap_merge'],
+                row['gap_min_segment'],
+                row['min_segment'],
+                expected['row'],
+                profiles,
+            )
+        base = axis_options(options, 'col')
+        windows = []
+        from_row_choices = [options['col_scan_from_row']] if options['col_scan_from_row'] is not None else [None]
+        if row_segments and -1 not in from_row_choices:
+            from_row_choices.append(-1)
+        for from_row in from_row_choices:
+            scan_y = base['scan_y'] if from_row is None or not row_segments else select_row_window(row_segments, from_row)
+            window = {} if from_row is None else {'col_scan_from_row': from_row}
+            windows.append((window, base['scan_x'], scan_y))
+        base['scan_y'] = windows[0][2]
+        tuned = autotune_axis(profiles, 'col', expected['col'], autotune_candidates(base, windows), workers)
+        for line in format_autotune_table(tuned, top):
+            print(line, file=sys.stderr)
+        if tuned['ranked']:
+            apply_axis_candidate(options, 'col', tuned['ranked'][0]['candidate'])
+            tuned_axes.append('col')
+        summary['cols'] = tuned
+
+    if tuned_axes:
+        print(f"[autotune] 最佳参数: {autotune_cli_args(options, tuned_axes)}", file=sys.stderr)
+    if options['pyramid']:
+        print("[info] 自动调参使用全分辨率曲线，已忽略 --pyramid", file=sys.stderr)
+        options['pyramid'] = None
+    config = build_config_from_options(options, profiles=profiles)
+    config['autotune'] = {
+        key: {
+            'expected': tuned['expected'],
+            'candidates': tuned['candidates'],
+            'evaluated': tuned['evaluated'],
+            'perfect': tuned['perfect'],
+            'seconds': tuned['seconds'],
+        }
+        for key, tuned in summary.items()
+    }
+    return config
+
+
+def handle_worker_request(
+    request: dict,
+    base: dict,
+    types: Dict[str, type],
+    cache: ScanResultCache | None,
+    images: DecodedImageCache,
+    pretty: bool,
+) -> dict:
+    command = request.get('command', 'scan')
+    if command == 'stats':
+        stats = {'images': images.stats()}
+        if cache is not None:
+            stats['cache'] = {'hits': cache.hits, 'misses': cache.misses}
+        return {'ok': True, 'stats': stats}
+    if command != 'scan':
+        raise ValueError(f"Unknown worker command: {command}")
+    options = {**base, **normalize_options(request.get('options', {}), base, 'options', types)}
+    if not options['image']:
+        raise ValueError('options 缺少 image')
+    notes: List[str] = []
+    decode_misses = images.misses
+    config = attach_variants(build_config_from_options(options, notes, cache, images=images), options, notes, pretty)
+    if options['output']:
+        write_config(config, options['output'], pretty)
+    return {'ok': True, 'config': config, 'notes': notes, 'decoded': images.misses > decode_misses}
+
+
+def run_worker(parser: argparse.ArgumentParser, pretty: bool, use_cache: bool, cache_mb: float) -> int:
+    """常驻模式：每行一个请求 {"id", "command"?, "options"}，每行一个响应 {"id", "ok", ...}。
+
+    command 缺省为 scan（options 的键与批量清单相同）；stats 返回解码缓存与结果缓存的统计；
+    shutdown 或 stdin 关闭时退出。单个请求出错只返回 ok=false，不影响后续请求。
+    """
+    base = default_scan_options(parser)
+    types = scan_option_types(parser)
+    cache = ScanResultCache() if use_cache else None
+    images = DecodedImageCache(int(cache_mb * 1024 * 1024))
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        request_id = None
+        shutdown = False
+        started = time.perf_counter()
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('Worker request must be a JSON object')
+            request_id = request.get('id')
+            shutdown = request.get('command') == 'shutdown'
+            if shutdown:
+                response = {'ok': True}
+            else:
+                response = handle_worker_request(request, base, types, cache, images, pretty)
+        except Exception as exc:
+            response = {'ok': False, 'error': f"{type(exc).__name__}: {exc}"}
+        response = {'id': request_id, **response, 'seconds': round(time.perf_counter() - started, 4)}
+        sys.stdout.write(json.dumps(response, ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+        if shutdown:
+            break
+    return 0
+
+
+def main() -> None:
+    if len(sys.argv) in (4, 5) and not sys.argv[1].startswith('-'):
+        # 位置参数诊断：<图片> <行数> <列数> [缩小倍数 2|4|8]
+        analyze_grid(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]) if len(sys.argv) == 5 else 1)
+        return
+
+    parser = build_arg_parser()
+    args = parser.parse_args()
+
+    if args.worker:
+        sys.exit(run_worker(parser, args.pretty, not args.no_cache, args.worker_cache_mb))
+    if args.batch:
+        sys.exit(run_batch(args.batch, parser, args.workers, args.summary, args.pretty, not args.no_cache))
+    if not args.image:
+        parser.error('需要 --image（或使用 --batch 指定清单）')
+    if args.autotune:
+        if args.expected_rows is None and args.expected_cols is None:
+            parser.error('--autotune 需要 --expected-rows 或 --expected-cols')
+        if args.template:
+            parser.error('--autotune 不能与 --template 同时使用')
+        if args.slice:
+            parser.error('--autotune 不能与 --slice 同时使用')
+        config = attach_variants(run_autotune(vars(args), args.workers, args.autotune_top), vars(args), None, args.pretty)
+        print(json.dumps(config, ensure_ascii=False, indent=2 if args.pretty else None))
+        if args.output:
+            write_config(config, args.output, args.pretty)
+        return
+
+    cache = None if args.no_cache else ScanResultCache()
+    config = attach_variants(build_config_from_options(vars(args), cache=cache), vars(args), None, args.pretty)
+    if cache is not None:
+        print(f"[cache] 命中 {cache.hits} / 未命中 {cache.misses}（{cache.root}）", file=sys.stderr)
 
     indent = 2 if args.pretty else None
     output = json.dumps(config, ensure_ascii=False, indent=indent)
     print(output)
     if args.output:
-        with open(args.output, 'w', encoding='utf-8') as f:
-            f.write(output)
+        write_config(config, args.output, args.pretty)
+    if args.slice:
+        index = slice_cells(args.image, config, args.slice, args.slice_format, args.workers, args.slice_keep_empty)
+        print(
+            f"[slice] 写出 {len(index['cells'])} 张，跳过空格 {len(index['skipped'])} 张（{args.slice}）",
+            file=sys.stderr,
+        )
 
 
 if __name__ == '__main__':
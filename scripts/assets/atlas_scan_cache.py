@@ -0,0 +1,166 @@
+"""
+图集扫描结果缓存
+- 以图片内容哈希 + 完整扫描参数为键，把 build_config 的结果存到磁盘
+- 按总大小上限做 LRU 淘汰（命中时刷新 mtime），并统计命中/未命中次数
+- 解码像素缓存：把解码后的单通道平面存成 .npy，之后以内存映射方式读入，跳过解码
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Callable
+
+try:
+    import numpy as np
+except ImportError as exc:
+    raise SystemExit("缺少 NumPy 依赖，请先执行: python -m pip install numpy") from exc
+
+DEFAULT_CACHE_DIR = Path(os.getenv("ATLAS_SCAN_CACHE_DIR", str(Path.cwd() / ".cache" / "atlas-scan")))
+DEFAULT_CACHE_MAX_MB = int(os.getenv("ATLAS_SCAN_CACHE_MAX_MB", "64"))
+DEFAULT_PIXEL_CACHE_DIR = Path(os.getenv("ATLAS_SCAN_PIXEL_CACHE_DIR", str(Path.cwd() / ".cache" / "atlas-pixels")))
+DEFAULT_PIXEL_CACHE_MAX_MB = int(os.getenv("ATLAS_SCAN_PIXEL_CACHE_MAX_MB", "1024"))
+# 设为 1 时网格诊断等脚本也读写解码像素缓存（atlas_grid_scan.py 另有 --pixel-cache）
+PIXEL_CACHE_ENABLED = os.getenv("ATLAS_SCAN_PIXEL_CACHE", "") not in ("", "0")
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def hash_file(path: str | Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(image_hash: str, params: dict) -> str:
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(f"{image_hash}\n{payload}".encode("utf-8")).hexdigest()
+
+
+def evict_lru(root: Path, pattern: str, max_bytes: int) -> int:
+    """删除最久未使用（mtime 最早）的文件，直到总大小不超过 max_bytes，返回删除个数。"""
+    entries = []
+    total = 0
+    for path in root.glob(pattern):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+        except OSError:
+            # 其他进程可能已经删掉了同一个文件
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+class ScanResultCache:
+    def __init__(self, root: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_MAX_MB * 1024 * 1024) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(image_hash: str, params: dict) -> str:
+        return make_cache_key(image_hash, params)
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def get(self, key: str) -> dict | None:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: dict) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        # 先写临时文件再替换，避免并行批量任务读到半截 JSON
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self.evictions += evict_lru(self.root, "*.json", self.max_bytes)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class DecodedPixelCache:
+    """解码像素缓存：同一张图（按内容哈希）的单通道平面只解码一次，之后 np.load(mmap_mode="r") 映射读入。
+
+    映射数组只读、按需分页，条带遍历时不会把整图读进内存；总大小超过上限时按 mtime 淘汰。
+    """
+
+    def __init__(self, root: Path = DEFAULT_PIXEL_CACHE_DIR, max_bytes: int = DEFAULT_PIXEL_CACHE_MAX_MB * 1024 * 1024) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(image_hash: str, plane: str = "luminance") -> str:
+        return make_cache_key(image_hash, {"plane": plane})
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.npy"
+
+    def get(self, key: str) -> np.ndarray | None:
+        path = self._path(key)
+        try:
+            pixels = np.load(path, mmap_mode="r")
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pixels
+
+    def put(self, key: str, pixels: np.ndarray) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(pixels))
+        os.replace(tmp_path, path)
+        # 刚写入的这张即使单独超出上限也保留，供本次扫描使用
+        self.evictions += evict_lru(self.root, "*.npy", max(self.max_bytes, path.stat().st_size))
+
+    def load(
+        self,
+        image_path: str | Path,
+        decode: Callable[[], np.ndarray],
+        plane: str = "luminance",
+        image_hash: str | None = None,
+    ) -> np.ndarray:
+        """命中时返回映射数组；未命中时调用 decode() 解码并写入缓存，返回解码结果。"""
+        key = self.make_key(image_hash or hash_file(image_path), plane)
+        pixels = self.get(key)
+        if pixels is None:
+            pixels = decode()
+            self.put(key, pixels)
+        return pixels
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,409 @@
+"""
+图集网格扫描基准测试
+- 按给定规格生成合成卡牌图集（行列数、卡牌尺寸、间距、边距、噪声、最后一行只排部分卡牌），并记录真实行/列分段
+- 对每种 指标 × 检测模式 计时 scan_axis_metric（含曲线计算），再端到端计时 build_config（含解码，整图 / 流式）
+- 计时不开 tracemalloc，峰值内存单独再跑一遍用 tracemalloc 统计（NumPy 分配可追踪，Pillow 内部缓冲不计入）
+- 金字塔扫描（--pyramid N）按 固定阈值 / 预期段数 / 自动阈值+预期段数 三组参数计时，结果与同参数的全分辨率扫描逐段对比，
+  并用 --pyramid-verify 复核
+- 缩放变体（--variants）：用 compress_images 生成真实的 compressed/<名称>.webp，计时 emit_variant_configs，
+  要求边界校验通过（verified），派生的各段与按比例缩放的真实分段相差不超过变体的边界容差
+- 每次识别结果都与参考分段（金字塔为全分辨率结果，其余为真实分段）对比，段数不符或边界误差超过容差即判为失败，退出码为 1
+
+用法：
+  python scripts/assets/bench_atlas_grid_scan.py
+  python scripts/assets/bench_atlas_grid_scan.py --scenarios small,noisy --metrics max,mean --repeat 5 --json bench.json
+  python scripts/assets/bench_atlas_grid_scan.py --scenarios noisy --pyramid 2,4,8
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+try:
+    from PIL import Image
+except ImportError as exc:
+    raise SystemExit("缺少 Pillow 依赖，请先执行: python -m pip install Pillow") from exc
+
+try:
+    import numpy as np
+except ImportError as exc:
+    raise SystemExit("缺少 NumPy 依赖，请先执行: python -m pip install numpy") from exc
+
+import compress_images
+from atlas_grid_scan import (
+    PROFILE_METRICS,
+    PYRAMID_FACTORS,
+    ProfileCache,
+    build_arg_parser,
+    build_config_from_options,
+    emit_variant_configs,
+    scan_axis_metric,
+    variant_snap_tolerance,
+)
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块，只输出 tracemalloc 峰值
+    resource = None
+
+BACKGROUND_LEVEL = 8
+CARD_TEXTURE = 25
+BENCH_DETECT_MODES = ('content', 'gap')
+# content 模式按 (最大值 - 最小值) 的比例取阈值；
+# gap 模式的分位数阈值对噪声很敏感（间隙会被切碎），改用各指标量纲下的固定阈值
+CONTENT_AUTO_THRESHOLD = 0.25
+GAP_THRESHOLDS = {'max': 60, 'mean': 30, 'variance': 200, 'edge': 60}
+# 金字塔场景的参数组：fixed 为命令行默认（固定阈值），expect 只给预期行列数，auto 与 build_config 计时相同
+PYRAMID_VARIANTS = ('fixed', 'expect', 'auto')
+# 合成图集的间距最窄 8px，缩小倍数超过间距一半时间隙会在粗图里被块均值抹掉
+DEFAULT_PYRAMID_FACTORS = (2, 4)
+
+
+@dataclass(frozen=True)
+class AtlasSpec:
+    name: str
+    rows: int
+    cols: int
+    cell_w: int
+    cell_h: int
+    gutter: int
+    margin: int
+    noise: float
+    last_row_cards: int | None = None
+
+    @property
+    def width(self) -> int:
+        return self.margin * 2 + self.cols * self.cell_w + (self.cols - 1) * self.gutter
+
+    @property
+    def height(self) -> int:
+        return self.margin * 2 + self.rows * self.cell_h + (self.rows - 1) * self.gutter
+
+    @property
+    def megapixels(self) -> float:
+        return self.width * self.height / 1_000_000
+
+    def truth(self, axis: str) -> List[Tuple[int, int]]:
+        count, cell = (self.rows, self.cell_h) if axis == 'row' else (self.cols, self.cell_w)
+        return [(self.margin + i * (cell + self.gutter), cell) for i in range(count)]
+
+    def scaled_truth(self, axis: str, size: int) -> List[Tuple[int, int]]:
+        """缩放到 size（该轴的变体尺寸）后的真实分段，起点/终点各自四舍五入。"""
+        scale = size / (self.height if axis == 'row' else self.width)
+        return [
+            (round(start * scale), round((start + length) * scale) - round(start * scale))
+            for start, length in self.truth(axis)
+        ]
+
+
+SCENARIOS: Dict[str, AtlasSpec] = {
+    spec.name: spec
+    for spec in (
+        AtlasSpec('small', rows=4, cols=6, cell_w=180, cell_h=250, gutter=8, margin=6, noise=0),
+        AtlasSpec('noisy', rows=5, cols=8, cell_w=240, cell_h=336, gutter=12, margin=10, noise=4, last_row_cards=3),
+        AtlasSpec('large', rows=7, cols=10, cell_w=400, cell_h=560, gutter=20, margin=16, noise=3, last_row_cards=6),
+        AtlasSpec('xl', rows=10, cols=14, cell_w=560, cell_h=780, gutter=24, margin=20, noise=3, last_row_cards=5),
+    )
+}
+DEFAULT_SCENARIOS = ('small', 'noisy', 'large')
+
+
+def make_atlas(spec: AtlasSpec, seed: int) -> np.ndarray:
+    """生成灰度合成图集：暗背景（可加高斯噪声）上排列带随机纹理的卡牌。"""
+    rng = np.random.default_rng(seed)
+    canvas = np.full((spec.height, spec.width), BACKGROUND_LEVEL, dtype=np.float32)
+    if spec.noise:
+        canvas += rng.normal(0, spec.noise, canvas.shape).astype(np.float32)
+    row_truth = spec.truth('row')
+    col_truth = spec.truth('col')
+    for r, (y, cell_h) in enumerate(row_truth):
+        cards = spec.cols if r < spec.rows - 1 or spec.last_row_cards is None else spec.last_row_cards
+        for x, cell_w in col_truth[:cards]:
+            base = rng.uniform(90, 220)
+            texture = rng.uniform(-CARD_TEXTURE, CARD_TEXTURE, (cell_h, cell_w)).astype(np.float32)
+            canvas[y:y + cell_h, x:x + cell_w] = base + texture
+    return np.clip(canvas, 0, 255).astype(np.uint8)
+
+
+def boundary_error(found: List[Tuple[int, int]], truth: List[Tuple[int, int]]) -> int | None:
+    """段数一致时返回起点/终点的最大偏差，段数不一致返回 None。"""
+    if len(found) != len(truth):
+        return None
+    return max(
+        (max(abs(fs - ts), abs((fs + fl) - (ts + tl))) for (fs, fl), (ts, tl) in zip(found, truth)),
+        default=0,
+    )
+
+
+def time_call(func: Callable[[], object], repeat: int) -> Tuple[List[float], object]:
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - started)
+    return samples, result
+
+
+def traced_peak(func: Callable[[], object]) -> int:
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def axis_params(spec: AtlasSpec, axis: str, metric: str, detect_mode: str) -> dict:
+    content = detect_mode == 'content'
+    return {
+        'threshold': 20 if content else GAP_THRESHOLDS[metric],
+        'auto_threshold': CONTENT_AUTO_THRESHOLD if content else None,
+        'gap_merge': 2,
+        'gap_min_segment': 1,
+        'min_segment': 5,
+        'expected': spec.rows if axis == 'row' else spec.cols,
+    }
+
+
+def scan_both_axes(pixels: np.ndarray, spec: AtlasSpec, metric: str, detect_mode: str) -> Dict[str, list]:
+    profiles = ProfileCache(pixels)
+    full = ((0, -1), (0, -1))
+    found = {}
+    for axis in ('row', 'col'):
+        params = axis_params(spec, axis, metric, detect_mode)
+        found[axis] = scan_axis_metric(
+            None,
+            axis,
+            metric,
+            params['threshold'],
+            params['auto_threshold'],
+            detect_mode,
+            *full,
+            params['gap_merge'],
+            params['gap_min_segment'],
+            params['min_segment'],
+            params['expected'],
+            profiles,
+        )
+    return found
+
+
+def build_options(
+    image_path: str,
+    spec: AtlasSpec,
+    stream: bool,
+    variant: str = 'auto',
+    pyramid: int | None = None,
+) -> dict:
+    args = ['--image', image_path]
+    if variant == 'auto':
+        args += ['--auto-threshold', str(CONTENT_AUTO_THRESHOLD)]
+    if variant in {'expect', 'auto'}:
+        args += ['--expected-rows', str(spec.rows), '--expected-cols', str(spec.cols)]
+    if stream:
+        args.append('--stream')
+    if pyramid:
+        args += ['--pyramid', str(pyramid)]
+    return vars(build_arg_parser().parse_args(args))
+
+
+def config_segments(config: dict) -> Dict[str, list]:
+    return {
+        'row': list(zip(config['rowStarts'], config['rowHeights'])),
+        'col': list(zip(config['colStarts'], config['colWidths'])),
+    }
+
+
+def summarize(
+    case: dict,
+    samples: List[float],
+    peak: int,
+    found: Dict[str, list],
+    reference: Dict[str, list],
+    spec: AtlasSpec,
+    tolerance: int,
+) -> dict:
+    errors = {axis: boundary_error(found[axis], reference[axis]) for axis in ('row', 'col')}
+    best = min(samples)
+    case.update({
+        'bestMs': round(best * 1000, 3),
+        'medianMs': round(statistics.median(samples) * 1000, 3),
+        'msPerMegapixel': round(best * 1000 / spec.megapixels, 3),
+        'peakTracedMB': round(peak / (1024 * 1024), 2),
+        'rows': len(found['row']),
+        'cols': len(found['col']),
+        'rowError': errors['row'],
+        'colError': errors['col'],
+        'ok': all(error is not None and error <= tolerance for error in errors.values()),
+    })
+    return case
+
+
+def run_scenario(spec: AtlasSpec, options: argparse.Namespace, workdir: Path) -> List[dict]:
+    pixels = make_atlas(spec, options.seed)
+    image_path = workdir / f"{spec.name}.png"
+    Image.fromarray(pixels).save(image_path)
+    truth = {axis: spec.truth(axis) for axis in ('row', 'col')}
+    cases = []
+
+    for metric in options.metrics:
+        for detect_mode in options.modes:
+            run = partial(scan_both_axes, pixels, spec, metric, detect_mode)
+            samples, found = time_call(run, options.repeat)
+            case = {'scenario': spec.name, 'target': 'scan_axis_metric', 'metric': metric, 'mode': detect_mode}
+            cases.append(summarize(case, samples, traced_peak(run), found, truth, spec, options.tolerance))
+
+    for stream in (False, True):
+        config_options = build_options(str(image_path), spec, stream)
+        run = partial(build_config_from_options, config_options, notes=[])
+        samples, config = time_call(run, options.repeat)
+        case = {
+            'scenario': spec.name,
+            'target': 'build_config',
+            'metric': config_options['metric'],
+            'mode': 'stream' if stream else 'decode',
+        }
+        cases.append(summarize(case, samples, traced_peak(run), config_segments(config), truth, spec, options.tolerance))
+
+    # 金字塔只比对同参数的全分辨率结果（固定阈值在噪声图上本身就认不出真实分段），边界必须逐像素一致
+    for variant in PYRAMID_VARIANTS if options.pyramid else ():
+        full = config_segments(build_config_from_options(build_options(str(image_path), spec, False, variant), notes=[]))
+        for factor in options.pyramid:
+            config_options = build_options(str(image_path), spec, False, variant, factor)
+            run = partial(build_config_from_options, config_options, notes=[])
+            samples, config = time_call(run, options.repeat)
+            verify = build_config_from_options({**config_options, 'pyramid_verify': True}, notes=[])['pyramid']
+            case = {
+                'scenario': spec.name,
+                'target': f'pyramid x{factor}',
+                'metric': config_options['metric'],
+                'mode': variant,
+            }
+            summarize(case, samples, traced_peak(run), config_segments(config), full, spec, 0)
+            case['ok'] = case['ok'] and verify['match']
+            case['speedup'] = verify['speedup']
+            cases.append(case)
+
+    # 缩放变体：对 compress_images 的真实输出（LANCZOS 缩小 + WebP 有损压缩）派生并校验配置；
+    # 长边不超过 IMAGE_MAX_EDGE 的场景变体与源图同尺寸
+    config = build_config_from_options(build_options(str(image_path), spec, False), notes=[])
+    with contextlib.redirect_stdout(sys.stderr):
+        compress_images.handle_file(image_path, workdir)
+    run = partial(emit_variant_configs, config, str(image_path), False, [])
+    samples, summaries = time_call(run, options.repeat)
+    summary = summaries[0]
+    size = (summary['imageW'], summary['imageH'])
+    derived = json.loads(Path(summary['output']).read_text(encoding='utf-8'))
+    reference = {'row': spec.scaled_truth('row', size[1]), 'col': spec.scaled_truth('col', size[0])}
+    case = {'scenario': spec.name, 'target': 'variants', 'metric': config['scan']['metric'], 'mode': 'webp'}
+    tolerance = variant_snap_tolerance((spec.width, spec.height), size)
+    summarize(case, samples, traced_peak(run), config_segments(derived), reference, spec, tolerance)
+    case['ok'] = case['ok'] and summary['verified']
+    case['variantSize'] = list(size)
+    cases.append(case)
+    return cases
+
+
+def format_table(cases: List[dict]) -> List[str]:
+    lines = [
+        f"{'scenario':<8} {'target':<16} {'metric':<8} {'mode':<7} {'best ms':>9} {'median ms':>9} "
+        f"{'ms/MP':>8} {'peak MB':>8} {'rows':>4} {'cols':>4} {'err':>7} result",
+    ]
+    for case in cases:
+        errors = '/'.join('-' if case[key] is None else str(case[key]) for key in ('rowError', 'colError'))
+        lines.append(
+            f"{case['scenario']:<8} {case['target']:<16} {case['metric']:<8} {case['mode']:<7} "
+            f"{case['bestMs']:>9.2f} {case['medianMs']:>9.2f} {case['msPerMegapixel']:>8.2f} "
+            f"{case['peakTracedMB']:>8.2f} {case['rows']:>4} {case['cols']:>4} {errors:>7} "
+            f"{'ok' if case['ok'] else 'FAIL'}"
+        )
+    return lines
+
+
+def split_list(value: str) -> List[str]:
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='图集网格扫描基准测试（合成图集 + 真实分段校验）')
+    parser.add_argument('--scenarios', default=','.join(DEFAULT_SCENARIOS), help=f"场景，逗号分隔: {', '.join(SCENARIOS)}")
+    parser.add_argument('--metrics', default=','.join(PROFILE_METRICS), help='扫描指标，逗号分隔')
+    parser.add_argument('--modes', default=','.join(BENCH_DETECT_MODES), help='检测模式，逗号分隔: content | gap')
+    parser.add_argument('--repeat', type=int, default=3, help='每项计时重复次数（取最快一次）')
+    parser.add_argument('--seed', type=int, default=7, help='合成图集随机种子')
+    parser.add_argument('--tolerance', type=int, default=2, help='边界允许误差（像素）')
+    parser.add_argument(
+        '--pyramid',
+        default=','.join(map(str, DEFAULT_PYRAMID_FACTORS)),
+        help='金字塔缩小倍数，逗号分隔（空字符串跳过金字塔场景）',
+    )
+    parser.add_argument('--keep-images', help='合成图集保存目录（默认临时目录，结束后删除）')
+    parser.add_argument('--json', help='结果写入 JSON 文件')
+    options = parser.parse_args()
+
+    options.metrics = split_list(options.metrics)
+    options.modes = split_list(options.modes)
+    try:
+        options.pyramid = [int(item) for item in split_list(options.pyramid)]
+    except ValueError:
+        parser.error(f"无效的金字塔倍数: {options.pyramid}")
+    unsupported_factors = [factor for factor in options.pyramid if factor not in PYRAMID_FACTORS]
+    if unsupported_factors:
+        parser.error(f"不支持的金字塔倍数: {', '.join(map(str, unsupported_factors))}")
+    # 合成图集是暗背景，gap-high（亮间隙）没有对应的真实分段，不参与基准
+    unsupported = [name for name in options.metrics if name not in PROFILE_METRICS]
+    unsupported += [name for name in options.modes if name not in BENCH_DETECT_MODES]
+    if unsupported:
+        parser.error(f"不支持的指标/检测模式: {', '.join(unsupported)}")
+    unknown = [name for name in split_list(options.scenarios) if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+    specs = [SCENARIOS[name] for name in split_list(options.scenarios)]
+
+    cases: List[dict] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(options.keep_images or tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        for spec in specs:
+            print(f"[bench] {spec.name}: {spec.width}x{spec.height} ({spec.megapixels:.1f} MP)", file=sys.stderr)
+            cases.extend(run_scenario(spec, options, workdir))
+
+    for line in format_table(cases):
+        print(line)
+    failed = [case for case in cases if not case['ok']]
+    max_rss_mb = None
+    if resource is not None:
+        # Linux 上 ru_maxrss 单位为 KB（macOS 为字节，这里按 KB 换算仅作参考）
+        max_rss_mb = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        print(f"[bench] 进程峰值 RSS: {max_rss_mb} MB", file=sys.stderr)
+    if failed:
+        print(f"[bench] {len(failed)} 项识别结果与参考分段不符", file=sys.stderr)
+
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'scenarios': [asdict(spec) for spec in specs],
+                'repeat': options.repeat,
+                'tolerance': options.tolerance,
+                'maxRssMB': max_rss_mb,
+                'cases': cases,
+            }, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,18 @@
-from PIL import Image
 import sys
 
+from integral_image import load_integral_image
+
 def check_edges(path, y_ratio, desc):
     try:
-        img = Image.open(path).convert('L')
-        w, h = img.size
+        integral = load_integral_image(path)
+        w, h = integral.size
         y = int(h * y_ratio)
         
         # Check first 50 pixels
-        left_vals = [img.getpixel((x, y)) for x in range(50)]
-        left_avg = sum(left_vals)/50
+        left_avg = integral.rect_mean((0, y, 50, y + 1))
         
         # Check last 50 pixels
-        right_vals = [img.getpixel((x, y)) for x in range(w-50, w)]
-        right_avg = sum(right_vals)/50
+        right_avg = integral.rect_mean((w - 50, y, w, y + 1))
         
         print(f"{desc}: LeftAvg={left_avg:.1f}, RightAvg={right_avg:.1f} (W={w}, Y={y})")
         
@@ -12,6 +12,7 @@ DEFAULT_ROOT = Path.cwd() / "public" / "assets"
 SKIP_DIR = "compressed"
 VALID_EXTS = {".png", ".jpg", ".jpeg"}
 MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "2048"))
+RESAMPLE = Image.LANCZOS
 WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "82"))
 CLEAN_OUTPUT = os.getenv("IMAGE_CLEAN", "0") == "1"
 
@@ -74,7 +75,7 @@ def resize_image(img: Image.Image) -> tuple[Image.Image, bool]:
     if max(width, height) <= MAX_EDGE:
         return img, False
     resized = img.copy()
-    resized.thumbnail((MAX_EDGE, MAX_EDGE), Image.LANCZOS)
+    resized.thumbnail((MAX_EDGE, MAX_EDGE), RESAMPLE)
     return resized, True
 
 
@@ -11,20 +11,35 @@ except ImportError as exc:
 VALID_EXTS = {".png", ".jpg", ".jpeg"}
 DEFAULT_MAX_WIDTH = int(os.getenv("ATLAS_MAX_WIDTH", "2048"))
 DEFAULT_PADDING = int(os.getenv("ATLAS_PADDING", "2"))
+# 单页最大高度；0 表示不分页（高度不设上限）。低端移动 GPU 的纹理上限常见为 2048x2048
+DEFAULT_MAX_HEIGHT = int(os.getenv("ATLAS_MAX_HEIGHT", "0"))
 
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="图集打包脚本（按行排列）")
     parser.add_argument("input_dir", help="输入图标目录，例如 public/assets/.../status-icons")
     parser.add_argument("--max-width", type=int, default=DEFAULT_MAX_WIDTH, help="图集最大宽度")
+    parser.add_argument(
+        "--max-height",
+        type=int,
+        default=DEFAULT_MAX_HEIGHT,
+        help="单页最大高度（与 --max-width 一起构成单页尺寸上限，放不下时分页输出；0=不分页）",
+    )
     parser.add_argument("--padding", type=int, default=DEFAULT_PADDING, help="图块间距")
     parser.add_argument("--name", type=str, default=None, help="输出文件名（不含扩展名）")
     parser.add_argument("--align-max", action="store_true", help="将图标对齐到最大宽高（透明填充）")
     parser.add_argument("--no-json", action="store_true", help="不输出 JSON 帧数据")
+    parser.add_argument(
+        "--packer",
+        choices=sorted(PACKERS),
+        default="shelf",
+        help="排布算法：shelf=按行排列 | maxrects=MaxRects 最短边贴合 | skyline=天际线左下优先",
+    )
     return parser.parse_args()
 
 
 def collect_images(input_dir: Path) -> list[dict]:
+    """只读图片文件头取尺寸，不解码像素；像素在 build_atlas 中逐张解码贴入。"""
     files = [
         path for path in input_dir.iterdir()
         if path.is_file() and path.suffix.lower() in VALID_EXTS
@@ -35,28 +50,35 @@ def collect_images(input_dir: Path) -> list[dict]:
     entries: list[dict] = []
     for path in sorted(files):
         with Image.open(path) as img:
-            converted = img.convert("RGBA") if img.mode != "RGBA" else img.copy()
+            width, height = img.size
         entries.append({
             "id": path.stem,
             "path": path,
-            "image": converted,
-            "w": converted.width,
-            "h": converted.height,
+            "w": width,
+            "h": height,
         })
 
     entries.sort(key=lambda item: (item["h"], item["w"]), reverse=True)
     return entries
 
 
-def pack_images(entries: list[dict], max_width: int, padding: int) -> tuple[dict, int, int]:
+def resolve_max_width(entries: list[dict], max_width: int) -> int:
     if not entries:
         raise SystemExit("没有可打包的图像")
 
     widest = max(item["cell_w"] for item in entries)
     if widest > max_width:
-        max_width = widest
         print(f"提示：最大单图宽度为 {widest}px，已自动提升 max-width。")
+        return widest
+    return max_width
+
+
+def pack_images(entries: list[dict], max_width: int, padding: int) -> tuple[dict, int, int]:
+    return _shelf_layout(entries, resolve_max_width(entries, max_width), padding)
+
 
+def _shelf_layout(entries: list[dict], max_width: int, padding: int) -> tuple[dict, int, int]:
+    """按行排列；max_width 须已由 resolve_max_width 处理过。"""
     x = 0
     y = 0
     row_height = 0
@@ -80,14 +102,218 @@ def pack_images(entries: list[dict], max_width: int, padding: int) -> tuple[dict
     return positions, atlas_width, atlas_height
 
 
+def _layout_size(positions: dict[str, dict]) -> tuple[int, int]:
+    width = max(frame["x"] + frame["w"] for frame in positions.values())
+    height = max(frame["y"] + frame["h"] for frame in positions.values())
+    return width, height
+
+
+def _maxrects_fit(
+    sizes: list[tuple[int, int]],
+    bin_w: int,
+    bin_h: int,
+    skip_unfit: bool = False,
+) -> list[tuple[int, int] | None] | None:
+    """MaxRects（最短边贴合 BSSF）：按顺序把每个矩形放进剩余边差最小的空闲矩形。
+
+    放不下时返回 None；skip_unfit 时跳过放不下的矩形（对应位置为 None），继续放后面的。
+    """
+    free = [(0, 0, bin_w, bin_h)]
+    placed: list[tuple[int, int] | None] = []
+    for w, h in sizes:
+        best = None
+        for fx, fy, fw, fh in free:
+            if w <= fw and h <= fh:
+                score = (min(fw - w, fh - h), max(fw - w, fh - h), fy, fx)
+                if best is None or score < best:
+                    best = score
+        if best is None:
+            if not skip_unfit:
+                return None
+            placed.append(None)
+            continue
+        x, y = best[3], best[2]
+        placed.append((x, y))
+
+        # 与新矩形相交的空闲矩形拆成最多 4 个剩余部分；原有空闲矩形互不包含，只需剔除被包含的新拆分部分
+        kept: list[tuple[int, int, int, int]] = []
+        split: list[tuple[int, int, int, int]] = []
+        for fx, fy, fw, fh in free:
+            if x >= fx + fw or x + w <= fx or y >= fy + fh or y + h <= fy:
+                kept.append((fx, fy, fw, fh))
+                continue
+            if x > fx:
+                split.append((fx, fy, x - fx, fh))
+            if x + w < fx + fw:
+                split.append((x + w, fy, fx + fw - x - w, fh))
+            if y > fy:
+                split.append((fx, fy, fw, y - fy))
+            if y + h < fy + fh:
+                split.append((fx, y + h, fw, fy + fh - y - h))
+
+        def contained(rect: tuple[int, int, int, int], other: tuple[int, int, int, int]) -> bool:
+            return (
+                other[0] <= rect[0] and other[1] <= rect[1]
+                and other[0] + other[2] >= rect[0] + rect[2] and other[1] + other[3] >= rect[1] + rect[3]
+            )
+
+        for i, rect in enumerate(split):
+            if any(contained(rect, other) for other in kept):
+                continue
+            # 相同的拆分部分只保留第一个
+            if any(contained(rect, other) and (other != rect or j < i) for j, other in enumerate(split) if j != i):
+                continue
+            kept.append(rect)
+        free = kept
+    return placed
+
+
+def pack_maxrects(entries: list[dict], max_width: int, padding: int) -> tuple[dict, int, int]:
+    """MaxRects BSSF：宽度固定为 max-width，二分查找能放下全部图块的最小高度。
+
+    间距按“每个图块右/下各扩 padding、画布同样扩 padding”处理，与 shelf 的间距口径一致。
+    """
+    max_width = resolve_max_width(entries, max_width)
+    sizes = [(item["cell_w"] + padding, item["cell_h"] + padding) for item in entries]
+    bin_w = max_width + padding
+    area = sum(w * h for w, h in sizes)
+    low = max(max(h for _, h in sizes), -(-area // bin_w))
+    high = sum(h for _, h in sizes)
+    best = _maxrects_fit(sizes, bin_w, high)
+    if best is None:
+        # 宽度已提升到最宽图块、高度取总高，仍放不下只可能是启发式碎片化：退回 shelf 排布
+        print("提示：maxrects 未能放下全部图块，已退回 shelf 排布。")
+        return _shelf_layout(entries, max_width, padding)
+    while low < high:
+        middle = (low + high) // 2
+        placed = _maxrects_fit(sizes, bin_w, middle)
+        if placed is None:
+            low = middle + 1
+        else:
+            high, best = middle, placed
+    positions = {
+        item["id"]: {"x": x, "y": y, "w": item["cell_w"], "h": item["cell_h"]}
+        for item, (x, y) in zip(entries, best)
+    }
+    return (positions, *_layout_size(positions))
+
+
+def pack_skyline(entries: list[dict], max_width: int, padding: int) -> tuple[dict, int, int]:
+    """天际线左下优先：维护各 x 区间当前顶边高度，每个图块放在使其顶边最低的位置（同高取最左）。"""
+    max_width = resolve_max_width(entries, max_width)
+    bin_w = max_width + padding
+    # 天际线：按 x 排序的 [起点, 宽度, 高度] 区间，覆盖 [0, bin_w)
+    skyline = [[0, bin_w, 0]]
+    positions: dict[str, dict] = {}
+    for item in entries:
+        w = item["cell_w"] + padding
+        h = item["cell_h"] + padding
+        best = None
+        for i, (x, _, _) in enumerate(skyline):
+            if x + w > bin_w:
+                break
+            y = 0
+            covered = 0
+            j = i
+            while covered < w:
+                y = max(y, skyline[j][2])
+                covered = skyline[j][0] + skyline[j][1] - x
+                j += 1
+            if best is None or (y + h, x) < (best[0] + h, best[1]):
+                best = (y, x)
+        y, x = best
+        positions[item["id"]] = {"x": x, "y": y, "w": item["cell_w"], "h": item["cell_h"]}
+
+        updated = []
+        for sx, sw, sy in skyline:
+            if sx + sw <= x or sx >= x + w:
+                updated.append([sx, sw, sy])
+                continue
+            if sx < x:
+                updated.append([sx, x - sx, sy])
+            if sx + sw > x + w:
+                updated.append([x + w, sx + sw - x - w, sy])
+        updated.append([x, w, y + h])
+        updated.sort()
+        skyline = []
+        for segment in updated:
+            if skyline and skyline[-1][2] == segment[2]:
+                skyline[-1][1] += segment[1]
+            else:
+                skyline.append(segment)
+    return (positions, *_layout_size(positions))
+
+
+PACKERS = {
+    "shelf": pack_images,
+    "maxrects": pack_maxrects,
+    "skyline": pack_skyline,
+}
+
+
+def pack_pages(
+    entries: list[dict],
+    packer_name: str,
+    max_width: int,
+    max_height: int,
+    padding: int,
+) -> list[tuple[list[dict], dict, int, int]]:
+    """按单页尺寸上限分页：返回 [(本页图块, 位置, 页宽, 页高), ...]。
+
+    每轮用所选排布算法排剩余图块，完整落在 max_height 以内的归入当前页，其余进入下一页重新排布
+    （maxrects 直接按页尺寸装箱）。
+    宽度上限不再自动提升；超过单页上限的图块直接报错。
+    """
+    oversize = [item["id"] for item in entries if item["cell_w"] > max_width or item["cell_h"] > max_height]
+    if oversize:
+        raise SystemExit(f"以下图块超过单页上限 {max_width}x{max_height}: {', '.join(oversize)}")
+
+    packer = PACKERS[packer_name]
+    pages: list[tuple[list[dict], dict, int, int]] = []
+    remaining = entries
+    while remaining:
+        if packer_name == "maxrects":
+            # MaxRects 直接在固定大小的页里放，放不下的留给下一页，页内空隙还能被后面的小图块填上
+            sizes = [(item["cell_w"] + padding, item["cell_h"] + padding) for item in remaining]
+            placed = _maxrects_fit(sizes, max_width + padding, max_height + padding, skip_unfit=True)
+            positions = {
+                item["id"]: {"x": spot[0], "y": spot[1], "w": item["cell_w"], "h": item["cell_h"]}
+                for item, spot in zip(remaining, placed)
+                if spot is not None
+            }
+        else:
+            positions, _, _ = packer(remaining, max_width, padding)
+        # 各排布算法都把第一个图块放在 (0, 0)，每页至少一个图块
+        page_items = [
+            item for item in remaining
+            if item["id"] in positions and positions[item["id"]]["y"] + item["cell_h"] <= max_height
+        ]
+        page_positions = {item["id"]: positions[item["id"]] for item in page_items}
+        pages.append((page_items, page_positions, *_layout_size(page_positions)))
+        remaining = [item for item in remaining if item["id"] not in page_positions]
+    return pages
+
+
+def occupancy(entries: list[dict], width: int, height: int) -> float:
+    """图块面积占图集面积的百分比。"""
+    used = sum(item["cell_w"] * item["cell_h"] for item in entries)
+    return used / (width * height) * 100 if width and height else 0.0
+
+
 def build_atlas(entries: list[dict], positions: dict[str, dict], width: int, height: int) -> Image.Image:
+    """按排布结果贴图。条目带 image 时直接使用，否则从 path 逐张解码，贴完即释放，峰值内存约为图集加一帧。"""
     atlas = Image.new("RGBA", (width, height), (0, 0, 0, 0))
     for item in entries:
         frame = positions[item["id"]]
-        atlas.paste(
-            item["image"],
-            (frame["x"] + item["offset_x"], frame["y"] + item["offset_y"])
-        )
+        box = (frame["x"] + item["offset_x"], frame["y"] + item["offset_y"])
+        if "image" in item:
+            atlas.paste(item["image"], box)
+            continue
+        with Image.open(item["path"]) as img:
+            if img.mode == "RGBA":
+                atlas.paste(img, box)
+            else:
+                atlas.paste(img.convert("RGBA"), box)
     return atlas
 
 
@@ -112,32 +338,46 @@ def main() -> None:
             item["offset_x"] = 0
             item["offset_y"] = 0
 
-    positions, width, height = pack_images(entries, args.max_width, args.padding)
+    paged = args.max_height > 0
+    if paged:
+        pages = pack_pages(entries, args.packer, args.max_width, args.max_height, args.padding)
+    else:
+        positions, width, height = PACKERS[args.packer](entries, args.max_width, args.padding)
+        pages = [(entries, positions, width, height)]
 
     output_dir = input_dir.parent
     output_name = args.name or f"{input_dir.name}-atlas"
-    output_image = output_dir / f"{output_name}.png"
     output_json = output_dir / f"{output_name}.json"
 
-    atlas = build_atlas(entries, positions, width, height)
-    atlas.save(output_image)
-
-    print(f"图集已生成: {output_image}")
+    page_meta = []
+    for index, (page_entries, positions, width, height) in enumerate(pages):
+        # 只有一页时文件名与不分页相同，已有引用不用改
+        suffix = f"-{index}" if len(pages) > 1 else ""
+        output_image = output_dir / f"{output_name}{suffix}.png"
+        atlas = build_atlas(page_entries, positions, width, height)
+        atlas.save(output_image)
+        page_meta.append({"image": output_image.name, "size": {"w": width, "h": height}})
+        print(
+            f"图集已生成: {output_image}（{width}x{height}，{args.packer} 占用率 "
+            f"{occupancy(page_entries, width, height):.1f}%）"
+        )
+    if paged:
+        print(f"共 {len(pages)} 页（单页上限 {args.max_width}x{args.max_height}）")
     if args.no_json:
         print("已跳过 JSON 输出（--no-json）")
         return
 
-    frames = {
-        item_id: {"frame": frame}
-        for item_id, frame in positions.items()
-    }
+    frames = {}
+    for index, (_, positions, _, _) in enumerate(pages):
+        for item_id, frame in positions.items():
+            frames[item_id] = {"frame": frame, "page": index} if paged else {"frame": frame}
+    # meta.image / meta.size 保持为第一页，只读单页图集的代码不受影响；分页时 meta.pages 按页号列出全部页
     data = {
-        "meta": {
-            "image": output_image.name,
-            "size": {"w": width, "h": height},
-        },
+        "meta": dict(page_meta[0]),
         "frames": frames,
     }
+    if paged:
+        data["meta"]["pages"] = page_meta
     output_json.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
     print(f"帧数据已生成: {output_json}")
 
@@ -0,0 +1,210 @@
+"""
+PNG 分条解码
+- 逐块读取 IDAT 并流式解压，每次只把一条水平条带交给 Pillow 解码
+- 条带仍带着 PNG 逐行滤波：在条带前补一行“上一行的已还原数据”（滤波类型 None），
+  拼成一张小 PNG 让 Pillow 还原，结果与整图解码逐像素一致
+- 小 PNG 的 IDAT 用不压缩的 stored 块：解压输出直接写进预分配缓冲区的对应位置，
+  不重新压缩、不拼接复制，条带数据在内存里只有一份
+- 仅支持 8 位、非隔行扫描的 PNG；其它情况抛出 UnsupportedPngError，由调用方回退整图解码
+"""
+
+from __future__ import annotations
+
+import io
+import struct
+import zlib
+from typing import Iterator, List, Tuple
+
+try:
+    from PIL import Image
+except ImportError as exc:
+    raise SystemExit("缺少 Pillow 依赖，请先执行: python -m pip install Pillow") from exc
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# color type -> 每像素通道数
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+READ_CHUNK_BYTES = 64 * 1024
+# deflate stored 块的最大数据长度；每次解压也按块内剩余长度截断，临时 bytes 不超过一块
+STORED_BLOCK_BYTES = 0xFFFF
+
+
+class UnsupportedPngError(ValueError):
+    pass
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+class _BufferReader(io.RawIOBase):
+    """只读、可定位的文件对象，直接读预分配缓冲区（io.BytesIO 会先复制一份 bytearray）。"""
+
+    def __init__(self, buffer: bytearray) -> None:
+        super().__init__()
+        self._view = memoryview(buffer)
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def readinto(self, target) -> int:
+        size = max(0, min(len(target), len(self._view) - self._pos))
+        target[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def close(self) -> None:
+        self._view.release()
+        super().close()
+
+
+class PngStripDecoder:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(8) != PNG_SIGNATURE:
+                raise UnsupportedPngError(f"不是 PNG 文件: {path}")
+            header: bytes | None = None
+            extra: List[bytes] = []
+            while True:
+                head = f.read(8)
+                if len(head) < 8:
+                    raise UnsupportedPngError(f"PNG 缺少 IDAT: {path}")
+                length, kind = struct.unpack(">I4s", head)
+                if kind == b"IDAT":
+                    self.idat_offset = f.tell() - 8
+                    break
+                data = f.read(length)
+                f.read(4)
+                if kind == b"IHDR":
+                    header = data
+                else:
+                    # PLTE / tRNS 等 IDAT 之前的块原样带到每张条带 PNG 里
+                    extra.append(_chunk(kind, data))
+        if header is None:
+            raise UnsupportedPngError(f"PNG 缺少 IHDR: {path}")
+        width, height, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", header)
+        if bit_depth != 8 or color_type not in PNG_CHANNELS:
+            raise UnsupportedPngError(f"仅支持 8 位 PNG（当前 bit_depth={bit_depth}, color_type={color_type}）")
+        if interlace:
+            raise UnsupportedPngError("不支持隔行扫描（Adam7）PNG")
+        self.width = width
+        self.height = height
+        self.header = header
+        self.extra_chunks = b"".join(extra)
+        self.channels = PNG_CHANNELS[color_type]
+        self.row_bytes = 1 + width * self.channels
+
+    def _idat_data(self) -> Iterator[bytes]:
+        with open(self.path, "rb") as f:
+            f.seek(self.idat_offset)
+            while True:
+                head = f.read(8)
+                if len(head) < 8:
+                    return
+                length, kind = struct.unpack(">I4s", head)
+                if kind != b"IDAT":
+                    return
+                remaining = length
+                while remaining > 0:
+                    data = f.read(min(READ_CHUNK_BYTES, remaining))
+                    if not data:
+                        return
+                    remaining -= len(data)
+                    yield data
+                f.read(4)
+
+    def _inflate_strip(
+        self,
+        decompressor: zlib._Decompress,
+        source: Iterator[bytes],
+        rows: int,
+        context: bytes | None,
+    ) -> bytearray:
+        """把接下来 rows 行的滤波数据解压进一张完整的小 PNG（IDAT 为 stored 块）。"""
+        raw_size = rows * self.row_bytes
+        if context is not None:
+            raw_size += self.row_bytes
+        blocks = max(1, -(-raw_size // STORED_BLOCK_BYTES))
+        header = struct.pack(">II", self.width, raw_size // self.row_bytes) + self.header[8:]
+        prefix = b"".join((
+            PNG_SIGNATURE,
+            _chunk(b"IHDR", header),
+            self.extra_chunks,
+            struct.pack(">I", 2 + raw_size + 5 * blocks + 4),
+            b"IDAT",
+            b"\x78\x01",
+        ))
+        idat_start = len(prefix) - 6
+        trailer = _chunk(b"IEND", b"")
+        buffer = bytearray(len(prefix) + raw_size + 5 * blocks + 8 + len(trailer))
+        view = memoryview(buffer)
+        view[:len(prefix)] = prefix
+
+        # 上下文行：滤波类型 None + 上一条带最后一行的已还原数据；宽图一行可能跨多个 stored 块
+        lead = b"" if context is None else b"\x00" + context
+        checksum = 1
+        pos = len(prefix)
+        raw = 0
+        for index in range(blocks):
+            length = min(STORED_BLOCK_BYTES, raw_size - raw)
+            final = 1 if index == blocks - 1 else 0
+            view[pos:pos + 5] = struct.pack("<BHH", final, length, length ^ 0xFFFF)
+            pos += 5
+            end = pos + length
+            if raw < len(lead):
+                take = min(len(lead) - raw, length)
+                view[pos:pos + take] = lead[raw:raw + take]
+                pos += take
+            while pos < end:
+                if decompressor.unconsumed_tail:
+                    data = decompressor.unconsumed_tail
+                else:
+                    data = next(source, b"")
+                    if not data:
+                        view.release()
+                        raise UnsupportedPngError(f"PNG 数据不完整: {self.path}")
+                out = decompressor.decompress(data, end - pos)
+                view[pos:pos + len(out)] = out
+                pos += len(out)
+            checksum = zlib.adler32(view[end - length:end], checksum)
+            raw += length
+        view[pos:pos + 4] = struct.pack(">I", checksum & 0xFFFFFFFF)
+        pos += 4
+        view[pos:pos + 4] = struct.pack(">I", zlib.crc32(view[idat_start:pos]) & 0xFFFFFFFF)
+        view[pos + 4:] = trailer
+        view.release()
+        return buffer
+
+    def iter_strips(self, strip_rows: int, stop_row: int | None = None) -> Iterator[Tuple[int, Image.Image]]:
+        """按 strip_rows 行一条依次产出 (起始行, 条带图像)，到 stop_row 为止（默认整图）。"""
+        stop_row = self.height if stop_row is None else min(stop_row, self.height)
+        strip_rows = max(1, strip_rows)
+        decompressor = zlib.decompressobj()
+        context: bytes | None = None
+        top = 0
+        source = self._idat_data()
+        while top < stop_row:
+            rows = min(strip_rows, stop_row - top)
+            with _BufferReader(self._inflate_strip(decompressor, source, rows, context)) as reader:
+                img = Image.open(reader)
+                img.load()
+            if context is not None:
+                img = img.crop((0, 1, self.width, rows + 1))
+            # 条带最后一行的已还原数据作为下一条带的上下文行
+            context = img.crop((0, rows - 1, self.width, rows)).tobytes()
+            yield top, img
+            # 解码下一条带前放掉本条带，避免两条带的图像同时驻留
+            del img
+            top += rows
@@ -1,24 +1,19 @@
-from PIL import Image
 import sys
 
+from integral_image import load_integral_image
+
 def scan_profile(path, y_percent):
     try:
-        img = Image.open(path).convert('L')
-        w, h = img.size
+        integral = load_integral_image(path)
+        w, h = integral.size
         y = int(h * y_percent)
         print(f"Scanning profile for {path} at y={y} (W={w})")
         
-        # Get pixels at row y
-        pixels = []
-        for x in range(w):
-            pixels.append(img.getpixel((x, y)))
-            
-        # Compress output: average every 50 pixels
+        # Compress output: average every 50 pixels of row y
         chunk_size = 50
         profile = ""
         for i in range(0, w, chunk_size):
-            chunk = pixels[i:i+chunk_size]
-            avg = sum(chunk) / len(chunk)
+            avg = integral.rect_mean((i, y, min(i + chunk_size, w), y + 1))
             if avg < 20: char = "_"
             elif avg < 100: char = "."
             elif avg < 200: char = "="
@@ -0,0 +1,209 @@
+"""
+精灵图裁切重排工具
+- 输入等分网格的精灵图（列数 × 行数），按每帧内容边界裁掉透明边，再用 pack_sprite_atlas 的排布打包成更小的图集
+- 每帧保留 sourceSize / spriteSourceSize（原帧尺寸与裁切偏移），按偏移放回原帧尺寸即可与原图逐像素一致
+- 逐张输出图集面积与文件大小的节省
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+from typing import List
+
+try:
+    from PIL import Image
+except ImportError as exc:
+    raise SystemExit("缺少 Pillow 依赖，请先执行: python -m pip install Pillow") from exc
+
+try:
+    import numpy as np
+except ImportError as exc:
+    raise SystemExit("缺少 NumPy 依赖，请先执行: python -m pip install numpy") from exc
+
+from compress_images import format_bytes
+from pack_sprite_atlas import DEFAULT_MAX_WIDTH, DEFAULT_PADDING, PACKERS, build_atlas, occupancy
+from scan_sprite_bounds import FrameBounds, content_mask, scan_sheet_bounds
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="精灵图裁切重排：裁掉每帧透明边后重新打包")
+    parser.add_argument("images", nargs="+", help="等分网格的精灵图（可多张，行列数相同）")
+    parser.add_argument("--cols", type=int, required=True, help="列数")
+    parser.add_argument("--rows", type=int, required=True, help="行数")
+    parser.add_argument(
+        "--threshold",
+        type=int,
+        default=None,
+        help="同时把 max(R,G,B) 不超过该值的像素视为空（黑底图用；被裁掉的暗像素无法还原，不再逐像素一致）",
+    )
+    parser.add_argument("--alpha-threshold", type=int, default=0, help="透明阈值 (0-255)，大于 0 时半透明边缘会被裁掉")
+    parser.add_argument("--max-width", type=int, default=DEFAULT_MAX_WIDTH, help="图集最大宽度")
+    parser.add_argument("--padding", type=int, default=DEFAULT_PADDING, help="图块间距")
+    parser.add_argument(
+        "--packer",
+        choices=sorted(PACKERS),
+        default="maxrects",
+        help="排布算法（同 pack_sprite_atlas.py --packer）；裁切后帧尺寸参差，默认 maxrects",
+    )
+    parser.add_argument("--out-dir", default=None, help="输出目录（默认与原图同目录）")
+    parser.add_argument("--suffix", default="-trimmed", help="输出文件名后缀（<原名><后缀>.png/.json）")
+    return parser.parse_args()
+
+
+def trim_frames(sheet: Image.Image, bounds_list: List[FrameBounds], stem: str) -> List[dict]:
+    """按内容矩形裁出每帧，条目格式与 pack_sprite_atlas.collect_images 相同；空帧 w/h 为 0。"""
+    digits = max(3, len(str(len(bounds_list) - 1)))
+    entries: List[dict] = []
+    for index, bounds in enumerate(bounds_list):
+        box = (bounds.x, bounds.y, bounds.x + bounds.width, bounds.y + bounds.height)
+        entries.append({
+            "id": f"{stem}_{index:0{digits}d}",
+            "bounds": bounds,
+            "image": sheet.crop(box),
+            "w": bounds.width,
+            "h": bounds.height,
+            "cell_w": bounds.width,
+            "cell_h": bounds.height,
+            "offset_x": 0,
+            "offset_y": 0,
+        })
+    return entries
+
+
+def frame_data(entry: dict, frame: dict, frame_w: int, frame_h: int) -> dict:
+    bounds: FrameBounds = entry["bounds"]
+    return {
+        "frame": frame,
+        "rotated": False,
+        "trimmed": (bounds.width, bounds.height) != (frame_w, frame_h),
+        "spriteSourceSize": {
+            "x": bounds.x - bounds.col * frame_w,
+            "y": bounds.y - bounds.row * frame_h,
+            "w": bounds.width,
+            "h": bounds.height,
+        },
+        "sourceSize": {"w": frame_w, "h": frame_h},
+    }
+
+
+def count_mismatched_frames(
+    sheet: Image.Image,
+    atlas: Image.Image,
+    frames: dict,
+    cols: int,
+    frame_w: int,
+    frame_h: int,
+) -> int:
+    """把每帧按 spriteSourceSize 放回原帧尺寸的透明画布，与原图逐像素比较（alpha 为 0 的像素只比 alpha）。"""
+    source = np.asarray(sheet)
+    packed = np.asarray(atlas)
+    mismatched = 0
+    for index, data in enumerate(frames.values()):
+        row, col = divmod(index, cols)
+        original = source[row * frame_h:(row + 1) * frame_h, col * frame_w:(col + 1) * frame_w]
+        restored = np.zeros_like(original)
+        frame, offset = data["frame"], data["spriteSourceSize"]
+        restored[offset["y"]:offset["y"] + frame["h"], offset["x"]:offset["x"] + frame["w"]] = packed[
+            frame["y"]:frame["y"] + frame["h"], frame["x"]:frame["x"] + frame["w"]
+        ]
+        visible = original[..., 3] > 0
+        if not (
+            np.array_equal(original[..., 3], restored[..., 3])
+            and np.array_equal(original[visible], restored[visible])
+        ):
+            mismatched += 1
+    return mismatched
+
+
+def repack_sheet(image_path: Path, args: argparse.Namespace) -> dict:
+    with Image.open(image_path) as img:
+        sheet = img.convert("RGBA")
+    image_w, image_h = sheet.size
+    frame_w = image_w // args.cols
+    frame_h = image_h // args.rows
+    if frame_w <= 0 or frame_h <= 0:
+        raise SystemExit(f"{image_path}: 行列数超出图片尺寸 {image_w}x{image_h}")
+
+    mask = content_mask(sheet, args.threshold, args.alpha_threshold)
+    bounds_list = scan_sheet_bounds(mask, args.cols, args.rows, frame_w, frame_h)
+    entries = trim_frames(sheet, bounds_list, image_path.stem)
+    # 与 collect_images 相同按高、宽降序排布；空帧不占图集空间
+    packable = [item for item in entries if item["w"] and item["h"]]
+    packable.sort(key=lambda item: (item["h"], item["w"]), reverse=True)
+    if not packable:
+        raise SystemExit(f"{image_path}: 所有帧都为空")
+
+    positions, width, height = PACKERS[args.packer](packable, args.max_width, args.padding)
+    atlas = build_atlas(packable, positions, width, height)
+
+    output_dir = Path(args.out_dir) if args.out_dir else image_path.parent
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_name = f"{image_path.stem}{args.suffix}"
+    output_image = output_dir / f"{output_name}.png"
+    output_json = output_dir / f"{output_name}.json"
+    atlas.save(output_image)
+
+    empty_frame = {"x": 0, "y": 0, "w": 0, "h": 0}
+    frames = {
+        item["id"]: frame_data(item, positions.get(item["id"], empty_frame), frame_w, frame_h)
+        for item in entries
+    }
+    data = {
+        "meta": {
+            "image": output_image.name,
+            "size": {"w": width, "h": height},
+            "source": {
+                "image": image_path.name,
+                "size": {"w": image_w, "h": image_h},
+                "cols": args.cols,
+                "rows": args.rows,
+            },
+        },
+        "frames": frames,
+    }
+    output_json.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    return {
+        "image": str(image_path),
+        "output": str(output_image),
+        "frames": len(entries),
+        "emptyFrames": len(entries) - len(packable),
+        "sourceArea": image_w * image_h,
+        "packedArea": width * height,
+        "size": (width, height),
+        "occupancy": occupancy(packable, width, height),
+        "sourceBytes": image_path.stat().st_size,
+        "packedBytes": output_image.stat().st_size,
+        "mismatchedFrames": count_mismatched_frames(sheet, atlas, frames, args.cols, frame_w, frame_h),
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    total_source_bytes = 0
+    total_packed_bytes = 0
+    for image in args.images:
+        image_path = Path(image).resolve()
+        if not image_path.is_file():
+            raise SystemExit(f"文件不存在: {image_path}")
+        result = repack_sheet(image_path, args)
+        total_source_bytes += result["sourceBytes"]
+        total_packed_bytes += result["packedBytes"]
+        area_ratio = result["packedArea"] / result["sourceArea"] * 100
+        print(
+            f"{image_path.name}: {result['frames']} 帧（空帧 {result['emptyFrames']}）-> "
+            f"{result['size'][0]}x{result['size'][1]}（{args.packer} 占用率 {result['occupancy']:.1f}%），"
+            f"面积 {area_ratio:.1f}%（节省 {100 - area_ratio:.1f}%），"
+            f"文件 {format_bytes(result['sourceBytes'])} -> {format_bytes(result['packedBytes'])}"
+        )
+        if result["mismatchedFrames"]:
+            print(f"  警告：{result['mismatchedFrames']} 帧按 spriteSourceSize 还原后与原图不一致（裁掉了非透明像素）")
+        print(f"  已生成: {result['output']}")
+    if len(args.images) > 1:
+        print(f"合计文件 {format_bytes(total_source_bytes)} -> {format_bytes(total_packed_bytes)}")
+
+
+if __name__ == "__main__":
+    main()
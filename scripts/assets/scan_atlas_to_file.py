@@ -1,14 +1,15 @@
-from PIL import Image
 import sys
 
+from integral_image import load_integral_image
+
 def analyze_grid(files):
     output = []
     
     for entry in files:
         path, r, c = entry
         try:
-            img = Image.open(path).convert('L')
-            w, h = img.size
+            integral = load_integral_image(path)
+            w, h = integral.size
             cell_w = w // c
             cell_h = h // r
             
@@ -23,9 +24,7 @@ def analyze_grid(files):
                     x = cc * cell_w
                     y = rr * cell_h
                     box = (x + 100, y + 100, x + cell_w - 100, y + cell_h - 100)
-                    region = img.crop(box)
-                    data = list(region.getdata())
-                    avg = sum(data) / len(data) if data else 0
+                    avg = integral.rect_mean(box)
                     
                     mark = "##" if avg < 15 else f"{idx:02}"
                     row_items.append(mark)
@@ -2,6 +2,7 @@
 精灵图内容边界扫描工具
 - 用于识别图集每一帧真实内容区域（裁切掉黑边/透明边）
 - 输出每帧的内容矩形与建议配置
+- 整张图一次阈值化得到内容掩码（alpha + RGB 最大值），每帧边界由帧内逐行/逐列 any 归约得出
 """
 
 from __future__ import annotations
@@ -9,11 +10,17 @@ from __future__ import annotations
 import argparse
 from dataclasses import dataclass
 from typing import List, Tuple
+
 try:
     from PIL import Image
 except ImportError as exc:
     raise SystemExit("缺少 Pillow 依赖，请先执行: python -m pip install Pillow") from exc
 
+try:
+    import numpy as np
+except ImportError as exc:
+    raise SystemExit("缺少 NumPy 依赖，请先执行: python -m pip install numpy") from exc
+
 
 @dataclass
 class FrameBounds:
@@ -32,6 +39,66 @@ def is_content(pixel: Tuple[int, int, int, int], threshold: int, alpha_threshold
     return max(r, g, b) > threshold
 
 
+def content_mask(img: Image.Image, threshold: int | None, alpha_threshold: int) -> np.ndarray:
+    """整张图的内容掩码 (高, 宽)，逐像素判定与 is_content 相同：alpha > alpha_threshold 且 max(R, G, B) > threshold。
+
+    threshold 为 None 时只看 alpha（裁掉的只有透明像素，裁切后还原可逐像素一致）。
+    """
+    rgba = np.asarray(img.convert("RGBA"))
+    mask = rgba[..., 3] > alpha_threshold
+    if threshold is not None:
+        mask &= np.maximum(np.maximum(rgba[..., 0], rgba[..., 1]), rgba[..., 2]) > threshold
+    return mask
+
+
+def _first_last(flags: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """沿最后一维找第一个/最后一个 True：返回 (是否存在, 首个下标, 末个下标)。"""
+    found = flags.any(axis=-1)
+    first = flags.argmax(axis=-1)
+    last = flags.shape[-1] - 1 - flags[..., ::-1].argmax(axis=-1)
+    return found, first, last
+
+
+def scan_sheet_bounds(mask: np.ndarray, cols: int, rows: int, frame_w: int, frame_h: int) -> List[FrameBounds]:
+    """按 rows × cols 等分帧一次求出所有帧的内容矩形（行优先），无内容的帧为 (帧左上角, 0, 0)。
+
+    掩码裁到 rows*frame_h × cols*frame_w 后重排为 (行, 帧高, 列, 帧宽)，
+    对帧宽/帧高各做一次 any 得到每帧的行/列占用，再取首末位置。
+    列数/行数超过图片宽高时帧宽/帧高为 0，所有帧都没有内容。
+    """
+    if frame_w <= 0 or frame_h <= 0:
+        return [
+            FrameBounds(col, row, col * frame_w, row * frame_h, 0, 0)
+            for row in range(rows)
+            for col in range(cols)
+        ]
+    frames = mask[: rows * frame_h, : cols * frame_w].reshape(rows, frame_h, cols, frame_w)
+    row_flags = frames.any(axis=3).transpose(0, 2, 1)  # (行, 列, 帧高)
+    col_flags = frames.any(axis=1)  # (行, 列, 帧宽)
+    found, top, bottom = _first_last(row_flags)
+    _, left, right = _first_last(col_flags)
+
+    bounds_list: List[FrameBounds] = []
+    for row in range(rows):
+        for col in range(cols):
+            x0 = col * frame_w
+            y0 = row * frame_h
+            if not found[row, col]:
+                bounds_list.append(FrameBounds(col, row, x0, y0, 0, 0))
+                continue
+            bounds_list.append(
+                FrameBounds(
+                    col,
+                    row,
+                    x0 + int(left[row, col]),
+                    y0 + int(top[row, col]),
+                    int(right[row, col] - left[row, col]) + 1,
+                    int(bottom[row, col] - top[row, col]) + 1,
+                )
+            )
+    return bounds_list
+
+
 def scan_bounds(
     img: Image.Image,
     x0: int,
@@ -41,24 +108,10 @@ def scan_bounds(
     threshold: int,
     alpha_threshold: int,
 ) -> Tuple[int, int, int, int]:
-    pixels = img.load()
-    left = None
-    right = None
-    top = None
-    bottom = None
-
-    for y in range(y0, y0 + h):
-        for x in range(x0, x0 + w):
-            if is_content(pixels[x, y], threshold, alpha_threshold):
-                top = y if top is None else min(top, y)
-                bottom = y if bottom is None else max(bottom, y)
-                left = x if left is None else min(left, x)
-                right = x if right is None else max(right, x)
-
-    if left is None or right is None or top is None or bottom is None:
-        return x0, y0, 0, 0
-
-    return left, top, right - left + 1, bottom - top + 1
+    """单帧内容矩形 (left, top, width, height)；无内容时为 (x0, y0, 0, 0)。"""
+    mask = content_mask(img.crop((x0, y0, x0 + w, y0 + h)), threshold, alpha_threshold)
+    bounds = scan_sheet_bounds(mask, 1, 1, w, h)[0]
+    return bounds.x + x0, bounds.y + y0, bounds.width, bounds.height
 
 
 def main() -> None:
@@ -78,15 +131,8 @@ def main() -> None:
     print(f"image_size={image_w}x{image_h}")
     print(f"frame_size={frame_w}x{frame_h}")
 
-    bounds_list: List[FrameBounds] = []
-    for row in range(args.rows):
-        for col in range(args.cols):
-            x0 = col * frame_w
-            y0 = row * frame_h
-            left, top, width, height = scan_bounds(
-                img, x0, y0, frame_w, frame_h, args.threshold, args.alpha_threshold
-            )
-            bounds_list.append(FrameBounds(col, row, left, top, width, height))
+    mask = content_mask(img, args.threshold, args.alpha_threshold)
+    bounds_list = scan_sheet_bounds(mask, args.cols, args.rows, frame_w, frame_h)
 
     for idx, bounds in enumerate(bounds_list):
         print(